@@ -0,0 +1,34 @@
+"""Options for the size and shape of the synthetic hars used by the benchmarks."""
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("harf benchmarks")
+    group.addoption(
+        "--har-entries",
+        default="1000,10000,100000",
+        help="Comma separated numbers of entries of the synthetic hars.",
+    )
+    group.addoption(
+        "--body-depth",
+        type=int,
+        default=4,
+        help="How deep primitives are nested in the synthetic response bodies.",
+    )
+    group.addoption(
+        "--body-width",
+        type=int,
+        default=10,
+        help="How many children the containers of the synthetic response bodies have.",
+    )
+    group.addoption(
+        "--body-leaves",
+        type=int,
+        default=20,
+        help="How many primitives the synthetic response bodies have.",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "entries" in metafunc.fixturenames:
+        entries = metafunc.config.getoption("har_entries").split(",")
+        metafunc.parametrize("entries", [int(e) for e in entries], scope="module")
@@ -0,0 +1,197 @@
+"""Seeded generators for synthetic data used by the benchmarks.
+
+Unlike `tests/strategies.py` these are plain `random.Random` based so the same seed always produces
+the same (and arbitrarily large) document.
+"""
+
+import json
+import random
+from typing import Iterator, List
+
+from harf.jsonf import Json, JsonPrims
+
+
+def json_prim(rng: random.Random) -> JsonPrims:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return rng.randrange(1_000_000)
+    if kind == 1:
+        return f"value-{rng.randrange(1_000_000)}"
+    if kind == 2:
+        return rng.random()
+    return rng.choice([True, False, None])
+
+
+def json_document(leaves: int, depth: int = 4, width: int = 10, seed: int = 0) -> Json:
+    """A json document with exactly `leaves` primitives.
+
+    Containers alternate between dicts and lists, hold at most `width` children and primitives are
+    placed at most `depth` containers deep.
+    """
+    rng = random.Random(seed)
+    budget = [leaves]
+
+    def element(level: int) -> Json:
+        if level >= depth or budget[0] <= 1:
+            budget[0] -= 1
+            return json_prim(rng)
+        children: List[Json] = []
+        while budget[0] > 0 and len(children) < width:
+            children.append(element(level + 1))
+        if level % 2:
+            return children
+        return {f"key_{i}": c for i, c in enumerate(children)}
+
+    root: List[Json] = []
+    while budget[0] > 0:
+        root.append(element(1))
+    return root
+
+
+def deep_document(depth: int, seed: int = 0) -> Json:
+    """A json document nesting a single primitive `depth` containers deep."""
+    rng = random.Random(seed)
+    document = json_prim(rng)
+    for level in range(depth):
+        document = {"key": document} if level % 2 else [document]
+    return document
+
+
+def wide_document(width: int, seed: int = 0) -> Json:
+    """A json list of `width` primitives."""
+    rng = random.Random(seed)
+    return [json_prim(rng) for _ in range(width)]
+
+
+def har_entries(
+    entries: int,
+    body_leaves: int = 20,
+    depth: int = 4,
+    width: int = 10,
+    asset_size: int = 0,
+    comment_every: int = 0,
+    seed: int = 0,
+) -> Iterator[dict]:
+    """Yields `entries` har entries of a REST(ish) json api.
+
+    Every response body holds an `id` and a `json_document` of `body_leaves` primitives, about half of
+    the requests use an id returned by an earlier response.
+    With an `asset_size` every fourth entry is instead a `text/html` page of that many characters.
+    With a `comment_every` every entry at a multiple of it is preceded by a Comment Request.
+    """
+    rng = random.Random(seed)
+    token = f"token-{rng.randrange(1_000_000)}"
+    ids: List[int] = []
+    for i in range(entries):
+        if ids and rng.random() < 0.5:
+            used_id = rng.choice(ids)
+        else:
+            used_id = rng.randrange(1_000_000)
+        new_id = rng.randrange(1_000_000)
+        ids.append(new_id)
+        if comment_every and i % comment_every == 0:
+            yield _comment_request(f"page_{i // comment_every}")
+        if asset_size and i % 4 == 3:
+            mime_type = "text/html"
+            text = "".join(rng.choices("<>/abcdefghijklmnopqrstuvwxyz ", k=asset_size))
+        else:
+            mime_type = "application/json"
+            body = {
+                "id": new_id,
+                "data": json_document(
+                    body_leaves, depth, width, rng.randrange(1 << 32)
+                ),
+            }
+            text = json.dumps(body)
+        request = {
+            "method": "POST" if i % 2 else "GET",
+            "url": f"https://example.com/api/items/{used_id}",
+            "httpVersion": "HTTP/1.1",
+            "cookies": [{"name": "session", "value": token}],
+            "headers": [{"name": "Authorization", "value": f"Bearer {token}"}],
+            "queryString": [{"name": "page", "value": str(i % 10)}],
+            "headersSize": -1,
+            "bodySize": -1,
+        }
+        if i % 2:
+            request["postData"] = {
+                "mimeType": "application/json",
+                "text": json.dumps({"itemId": used_id, "page": i % 10}),
+            }
+        yield {
+            "startedDateTime": "2022-05-30T13:47:04.000Z",
+            "time": 1,
+            "request": request,
+            "response": {
+                "status": 200,
+                "statusText": "OK",
+                "httpVersion": "HTTP/1.1",
+                "cookies": [],
+                "headers": [{"name": "Content-Type", "value": mime_type}],
+                "content": {
+                    "size": len(text),
+                    "mimeType": mime_type,
+                    "text": text,
+                },
+                "redirectURL": "",
+                "headersSize": -1,
+                "bodySize": -1,
+            },
+            "cache": {},
+            "timings": {"send": 0, "wait": 1, "receive": 0},
+        }
+
+
+def _comment_request(name: str) -> dict:
+    return {
+        "startedDateTime": "2022-05-30T13:47:04.000Z",
+        "time": 0,
+        "request": {
+            "method": "GET",
+            "url": f"http://comment/{name}",
+            "httpVersion": "HTTP/1.1",
+            "cookies": [],
+            "headers": [],
+            "queryString": [],
+            "headersSize": -1,
+            "bodySize": -1,
+        },
+        "response": {
+            "status": 0,
+            "statusText": "",
+            "httpVersion": "",
+            "cookies": [],
+            "headers": [],
+            "content": {"size": 0, "mimeType": "x-unknown"},
+            "redirectURL": "",
+            "headersSize": -1,
+            "bodySize": -1,
+        },
+        "cache": {},
+        "timings": {"send": 0, "wait": 0, "receive": 0},
+    }
+
+
+def har_document(entries: int, **kwargs) -> dict:
+    """A har of `har_entries(entries, **kwargs)`."""
+    return {
+        "log": {
+            "version": "1.2",
+            "creator": {"name": "harf-benchmarks", "version": "0"},
+            "pages": [],
+            "entries": list(har_entries(entries, **kwargs)),
+        }
+    }
+
+
+def write_har(path, entries: int, **kwargs) -> None:
+    """Writes a har of `har_entries(entries, **kwargs)` to `path` one entry at a time."""
+    with open(path, "w") as file:
+        file.write('{"log": {"version": "1.2", ')
+        file.write('"creator": {"name": "harf-benchmarks", "version": "0"}, ')
+        file.write('"pages": [], "entries": [')
+        for i, entry in enumerate(har_entries(entries, **kwargs)):
+            if i:
+                file.write(", ")
+            json.dump(entry, file)
+        file.write("]}}")
@@ -0,0 +1,25 @@
+"""Benchmarks for building an `Env` from json.
+
+Run with `pytest benchmarks/test_json_env.py --benchmark-group-by=param:shape`, the mean time in each
+group should grow linearly with the number of leaves.
+"""
+
+import pytest
+
+from harf.correlations.envs import json_env
+
+from synthetic import json_document
+
+SHAPES = {
+    "flat": dict(depth=1, width=10),
+    "nested": dict(depth=4, width=10),
+    "deep": dict(depth=32, width=2),
+}
+
+
+@pytest.mark.parametrize("leaves", [1_000, 10_000, 100_000])
+@pytest.mark.parametrize("shape", SHAPES)
+def test_json_env(benchmark, shape, leaves):
+    document = json_document(leaves, **SHAPES[shape])
+    env = benchmark(json_env, document)
+    assert sum(map(len, env.values())) == leaves
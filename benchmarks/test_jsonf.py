@@ -0,0 +1,38 @@
+"""Benchmarks for folding very deep and very wide json documents."""
+
+import pytest
+
+from harf.correlations.envs import json_env
+from harf.jsonf import jsonf_cata
+
+from synthetic import deep_document, wide_document
+
+DOCUMENTS = {
+    "deep_10k": lambda: deep_document(10_000),
+    "wide_1m": lambda: wide_document(1_000_000),
+}
+
+
+def _count_leaves(element) -> int:
+    if isinstance(element, dict):
+        return sum(element.values())
+    if isinstance(element, list):
+        return sum(element)
+    return 1
+
+
+@pytest.fixture(scope="module", params=DOCUMENTS)
+def document(request):
+    return DOCUMENTS[request.param]()
+
+
+def test_jsonf_cata(benchmark, document):
+    leaves = benchmark.pedantic(
+        jsonf_cata, args=(_count_leaves, document), rounds=3, iterations=1
+    )
+    assert leaves >= 1
+
+
+def test_json_env(benchmark, document):
+    env = benchmark.pedantic(json_env, args=(document,), rounds=3, iterations=1)
+    assert len(env) >= 1
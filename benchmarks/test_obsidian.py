@@ -0,0 +1,52 @@
+"""Time to render the obsidian notes of a 10k entry har.
+
+`on_the_fly` renders every link from the env when it is used, like the exporter did before links
+were computed once per env by `mk_links`.
+"""
+
+import pytest
+from serde import from_dict
+from harf_serde import Har
+
+from harf.correlations.filters import filter_by_percentages
+from harf.correlations.pipeline import request_valued_env, response_valued_env
+from harf.correlations.obsidian import json_, mk_links, mk_obsidian
+import harf.correlations.obsidian as obsidian
+
+from synthetic import deep_document, har_document, json_document
+
+
+class _OnTheFlyLinks(dict):
+    def __init__(self, env):
+        self.env = env
+
+    def get(self, value):
+        return mk_links({value: self.env[value]})[value] if value in self.env else None
+
+
+@pytest.fixture(scope="module")
+def har_env():
+    har = from_dict(Har, har_document(10_000))
+    env = request_valued_env(har) + response_valued_env(har)
+    return har, filter_by_percentages(0.02, 0.98, env)
+
+
+@pytest.mark.parametrize("links", ["on_the_fly", "mk_links"])
+def test_mk_obsidian(benchmark, monkeypatch, har_env, links):
+    har, env = har_env
+    if links == "on_the_fly":
+        monkeypatch.setattr(obsidian, "mk_links", _OnTheFlyLinks)
+    notes = benchmark.pedantic(mk_obsidian, args=(env, har), rounds=3)
+    assert len(notes) > 10_000
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        pytest.param(lambda: json_document(100_000, depth=6), id="nested_100k"),
+        pytest.param(lambda: deep_document(5_000), id="deep_5k"),
+    ],
+)
+def test_json_note(benchmark, document):
+    note = benchmark(json_, {}, document())
+    assert note.startswith("- ")
@@ -0,0 +1,82 @@
+"""Memory used by paths compared to the plain dataclass chains they replaced.
+
+The bytes per path are in the `bytes_per_path` extra info and printed with `-s`.
+"""
+
+import tracemalloc
+from dataclasses import dataclass
+
+import pytest
+
+from harf.correlations.paths import (
+    BodyPath,
+    EndPath,
+    EntryPath,
+    IntPath,
+    ResponsePath,
+    StrPath,
+)
+
+PATHS = 100_000
+
+
+@dataclass
+class _IntPath:
+    index: int
+    next_: object
+
+
+@dataclass
+class _StrPath:
+    key: str
+    next_: object
+
+
+@dataclass
+class _EndPath:
+    pass
+
+
+@dataclass
+class _BodyPath:
+    next_: object
+
+
+@dataclass
+class _ResponsePath:
+    next_: object
+
+
+@dataclass
+class _EntryPath:
+    index: int
+    next_: object
+
+
+CLASSES = {
+    "dataclass": (_EntryPath, _ResponsePath, _BodyPath, _IntPath, _StrPath, _EndPath),
+    "slots": (EntryPath, ResponsePath, BodyPath, IntPath, StrPath, EndPath),
+}
+
+
+def build_paths(entry, response, body, int_, str_, end):
+    """`entry_i.response.body[j].id` paths like the ones of a list api."""
+    return [
+        entry(i // 100, response(body(int_(i % 100, str_("id", end())))))
+        for i in range(PATHS)
+    ]
+
+
+@pytest.mark.parametrize("classes", CLASSES)
+def test_path_memory(benchmark, classes):
+    def traced():
+        tracemalloc.start()
+        paths = build_paths(*CLASSES[classes])
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return paths, size
+
+    paths, size = benchmark.pedantic(traced, rounds=3)
+    assert len(paths) == PATHS
+    benchmark.extra_info["bytes_per_path"] = size / PATHS
+    print(f"\n{classes}: {size / PATHS:.0f} bytes per path")
@@ -0,0 +1,205 @@
+"""Time and peak memory of every stage of the `correlations` cli.
+
+Every stage runs on seeded synthetic hars of `--har-entries` entries whose response bodies are
+shaped by `--body-leaves`, `--body-depth` and `--body-width`, e.g.
+
+    pytest benchmarks/test_pipeline.py --har-entries 1000,10000 --benchmark-group-by=param:entries
+
+The peak memory allocated by a single run of a stage is in the `peak_memory_kib` extra info (see
+`--benchmark-json`) and printed with `-s`. Save a run with `--benchmark-autosave` and compare later
+runs against it with `--benchmark-compare`.
+"""
+
+import copy
+import io
+from functools import partial
+import tracemalloc
+
+import pytest
+from serde import from_dict
+from harf_serde import Har
+
+from harf.cli import str_env
+from harf.correlations.pipeline import (
+    entries_valued_envs,
+    request_valued_env,
+    response_valued_env,
+    sketch_entries,
+    valued_envs,
+)
+from harf.correlations.bodies import BodyMemo, BodyStore
+from harf.correlations.filters import (
+    count_histogram,
+    filter_by_percentages,
+    reference_counts,
+    top_values,
+)
+from harf.correlations.obsidian import mk_obsidian, renders_body
+from harf.correlations.render import write_env
+from harf.grouping.by_comment import icomment_requests
+
+from synthetic import har_document
+
+ROUNDS = 3
+
+
+def run_stage(benchmark, stage, *args, setup=None):
+    """Benchmarks `stage(*args)` and records the peak memory of one run of it.
+
+    `setup` returns fresh arguments for every run of stages that change their arguments.
+    """
+    tracemalloc.start()
+    try:
+        result = stage(*(setup() if setup else args))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory_kib"] = peak // 1024
+    print(f"\n{benchmark.name}: peak memory {peak // 1024} KiB")
+
+    if setup:
+        benchmark.pedantic(stage, setup=lambda: (setup(), {}), rounds=ROUNDS)
+    else:
+        benchmark.pedantic(stage, args=args, rounds=ROUNDS)
+    return result
+
+
+@pytest.fixture(scope="module")
+def har(request, entries):
+    option = request.config.getoption
+    return from_dict(
+        Har,
+        har_document(
+            entries,
+            body_leaves=option("body_leaves"),
+            depth=option("body_depth"),
+            width=option("body_width"),
+            comment_every=100,
+        ),
+    )
+
+
+@pytest.fixture(scope="module")
+def envs(har):
+    return request_valued_env(har), response_valued_env(har)
+
+
+@pytest.fixture(scope="module")
+def env(envs):
+    return envs[0] + envs[1]
+
+
+@pytest.fixture(scope="module")
+def filtered_env(env):
+    return filter_by_percentages(0.02, 0.98, env)
+
+
+def test_icomment_requests(benchmark, har, entries):
+    log = run_stage(benchmark, icomment_requests, setup=lambda: (copy.copy(har.log),))
+    assert len(log.entries) == entries
+
+
+def test_request_valued_env(benchmark, har):
+    env = run_stage(benchmark, request_valued_env, har)
+    assert env
+
+
+def test_response_valued_env(benchmark, har):
+    env = run_stage(benchmark, response_valued_env, har)
+    assert env
+
+
+def test_valued_envs(benchmark, har):
+    request_values, response_values = run_stage(benchmark, valued_envs, har)
+    assert request_values and response_values
+
+
+@pytest.mark.parametrize("consumed_only", [False, True])
+def test_entries_valued_envs(benchmark, har, consumed_only):
+    request_values, response_values, _ = run_stage(
+        benchmark,
+        partial(entries_valued_envs, consumed_only=consumed_only),
+        har.log.entries,
+    )
+    assert request_values and response_values
+
+
+def sketched_envs(entries):
+    """The envs of the values `filtered_env` might keep, found by a sketch of `entries` first."""
+    candidates = sketch_entries(entries).candidates(0.02, 0.98)
+    return entries_valued_envs(entries, keep=candidates)
+
+
+def test_sketched_envs(benchmark, har):
+    request_values, response_values, _ = run_stage(
+        benchmark, sketched_envs, har.log.entries
+    )
+    assert request_values
+
+
+@pytest.mark.parametrize("memo_size", [0, 1024])
+def test_valued_envs_of_repeated_bodies(benchmark, har, memo_size):
+    """Every body is repeated ten times, like a polled endpoint."""
+    repeated = copy.copy(har)
+    repeated.log = copy.copy(har.log)
+    repeated.log.entries = [e for e in har.log.entries[::10] for _ in range(10)]
+    request_values, response_values = run_stage(
+        benchmark,
+        lambda har, memo: valued_envs(har, memo=memo),
+        setup=lambda: (repeated, BodyMemo(memo_size)),
+    )
+    assert request_values and response_values
+
+
+def test_env_add(benchmark, envs):
+    env = run_stage(benchmark, lambda a, b: a + b, *envs)
+    assert len(env) == len(envs[0])
+
+
+def test_env_sub(benchmark, envs):
+    env = run_stage(benchmark, lambda a, b: a - b, *envs)
+    assert len(env) <= len(envs[0])
+
+
+def test_filter_by_percentages(benchmark, env):
+    filtered = run_stage(benchmark, filter_by_percentages, 0.02, 0.98, env)
+    assert len(filtered) <= len(env)
+
+
+def test_top_values(benchmark, env):
+    top = run_stage(benchmark, top_values, env, 100)
+    assert len(top) <= 100
+
+
+def test_count_histogram(benchmark, env):
+    histogram = run_stage(benchmark, lambda: count_histogram(reference_counts(env)))
+    assert sum(histogram.values()) == len(env)
+
+
+@pytest.mark.parametrize("diffable", [False, True], ids=["default", "diffable"])
+def test_str_env(benchmark, filtered_env, diffable):
+    text = run_stage(benchmark, str_env, filtered_env, False, diffable)
+    assert text
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "csv"])
+def test_write_env(benchmark, filtered_env, output_format):
+    written = run_stage(
+        benchmark, lambda: write_env(filtered_env, io.StringIO(), output_format)
+    )
+    assert written
+
+
+def test_mk_obsidian(benchmark, har, filtered_env, entries):
+    notes = run_stage(benchmark, mk_obsidian, filtered_env, har)
+    assert len(notes) > entries
+
+
+def test_mk_obsidian_from_store(benchmark, har, filtered_env, entries):
+    def setup():
+        store = BodyStore(renders_body)
+        valued_envs(har, store=store)
+        return filtered_env, har, store
+
+    notes = run_stage(benchmark, mk_obsidian, setup=setup)
+    assert len(notes) > entries
@@ -0,0 +1,51 @@
+"""Peak memory of the `correlations` cli with and without `--stream`.
+
+Each run happens in a fresh interpreter so its peak RSS can be measured, the results are in the
+`peak_rss_kib` extra info (see `--benchmark-json`) and printed with `-s`.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from synthetic import write_har
+
+_run_cli = """
+import resource, runpy, sys
+sys.argv = ["correlations", *sys.argv[1:]]
+try:
+    runpy.run_module("harf.cli", run_name="__main__")
+except SystemExit:
+    pass
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+@pytest.fixture(scope="module")
+def har_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("har") / "synthetic.har"
+    write_har(path, 5_000, body_leaves=20, asset_size=50_000)
+    return path
+
+
+def peak_rss(*args) -> int:
+    """Runs the cli with `args` and returns its peak RSS in KiB.
+
+    The cache is not used, a cached env of an earlier run would skip building the envs.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _run_cli, *map(str, args), "--no-cache"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return int(result.stderr.split()[-1])
+
+
+@pytest.mark.parametrize("flags", [(), ("--stream",)], ids=["from_json", "stream"])
+def test_correlations_peak_memory(benchmark, har_path, flags):
+    rss = benchmark.pedantic(peak_rss, args=(har_path, *flags), rounds=1)
+    benchmark.extra_info["peak_rss_kib"] = rss
+    print(f"\n{har_path.stat().st_size // 1024} KiB har {flags}: peak RSS {rss} KiB")
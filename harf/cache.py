@@ -0,0 +1,177 @@
+"""An on-disk cache of the envs built from a har file.
+
+Cache files are named after a hash of the har's content and the options the envs were built with,
+so a changed har or different options never load stale envs. Only options that change which paths
+are built are part of the name, filters by reference count are applied to the loaded envs. A cache
+file is
+
+    MAGIC | header length | json header | int64 arrays of every `EnvIndex`
+
+and is memory-mapped when loaded, so only the values, urls and reference counts are read up front
+and paths are decoded once they are used. Loading a cache file touches it, `prune_cache` removes
+the least recently used cache files once they take more than a given size.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import sys
+import tempfile
+from typing import List, Optional, Tuple
+
+from harf.correlations.envs import Env, TypedValue, plain_value
+from harf.correlations.index import EnvIndex
+
+MAGIC = b"HARFENV1"
+_array_names = ["value_offsets", "path_offsets", "codes"]
+
+
+def default_cache_dir() -> pathlib.Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "harf"
+
+
+def cache_file(cache_dir: pathlib.Path, har_path: str, **options) -> pathlib.Path:
+    """The cache file of the envs built from `har_path` with `options`."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(har_path, "rb") as har:
+        while chunk := har.read(1 << 20):
+            digest.update(chunk)
+    digest.update(MAGIC)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return pathlib.Path(cache_dir) / f"{digest.hexdigest()}.env"
+
+
+def _dump_value(value) -> list:
+    return [isinstance(value, TypedValue), plain_value(value)]
+
+
+def _load_value(value: list):
+    typed, value = value
+    return TypedValue(value) if typed else value
+
+
+def store_envs(
+    path: pathlib.Path, request_values: Env, response_values: Env, urls: List[str]
+) -> None:
+    indexes = [EnvIndex.from_env(request_values), EnvIndex.from_env(response_values)]
+    header = {
+        "byteorder": sys.byteorder,
+        "urls": urls,
+        "envs": [
+            {
+                "values": list(map(_dump_value, index.values)),
+                "strings": index.strings,
+                "lengths": [len(getattr(index, name)) for name in _array_names],
+            }
+            for index in indexes
+        ],
+    }
+    header_bytes = json.dumps(header).encode()
+    # Pad the header so the arrays are 8 byte aligned.
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Every writer has its own temporary file, runs on the same har never mix their writes.
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(MAGIC)
+            file.write(len(header_bytes).to_bytes(8, "little"))
+            file.write(header_bytes)
+            for index in indexes:
+                for name in _array_names:
+                    file.write(getattr(index, name).tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def prune_cache(
+    cache_dir: pathlib.Path, max_size: int, keep: Optional[pathlib.Path] = None
+) -> int:
+    """Removes the least recently used cache files in `cache_dir` until they take at most
+    `max_size` bytes, except for `keep`. Returns how many were removed.
+    """
+    files = []
+    for path in pathlib.Path(cache_dir).glob("*.env"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+    size = sum(file_size for _, file_size, _ in files)
+    removed = 0
+    for _, file_size, path in files:
+        if size <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        size -= file_size
+        removed += 1
+    return removed
+
+
+def _read_indexes(data: mmap.mmap) -> Optional[Tuple[EnvIndex, EnvIndex, List[str]]]:
+    start = len(MAGIC) + 8
+    header_length = int.from_bytes(data[len(MAGIC) : start], "little")
+    header = json.loads(data[start : start + header_length])
+    if header["byteorder"] != sys.byteorder:
+        return None
+
+    arrays = memoryview(data)[start + header_length :]
+    if len(arrays) < 8 * sum(sum(env["lengths"]) for env in header["envs"]):
+        return None
+    arrays = arrays[: len(arrays) // 8 * 8].cast("q")
+    indexes = []
+    for env in header["envs"]:
+        parts = []
+        for length in env["lengths"]:
+            parts.append(arrays[:length])
+            arrays = arrays[length:]
+        indexes.append(
+            EnvIndex(list(map(_load_value, env["values"])), *parts, env["strings"])
+        )
+    return indexes[0], indexes[1], header["urls"]
+
+
+def load_indexes(
+    path: pathlib.Path,
+) -> Optional[Tuple[EnvIndex, EnvIndex, List[str]]]:
+    """The request valued index, response valued index and urls in the cache file, if there is one.
+
+    A damaged cache file is a miss, so it is built and stored again.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    if data[: len(MAGIC)] != MAGIC:
+        return None
+    try:
+        indexes = _read_indexes(data)
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+    if indexes is not None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return indexes
+
+
+def load_envs(path: pathlib.Path) -> Optional[Tuple[Env, Env, List[str]]]:
+    """The request valued env, response valued env and urls in the cache file, if there is one."""
+    indexes = load_indexes(path)
+    if indexes is None:
+        return None
+    return indexes[0].to_env(), indexes[1].to_env(), indexes[2]
@@ -1,92 +1,103 @@
 import code
+import collections
 import colorsys
+import dataclasses
 import glob
+import os
 import shutil
 import pathlib
 from functools import partial
 from itertools import chain
 from importlib import resources
-from json import dumps, load, dump
-from typing import Callable
+from json import load, dump
+from typing import Callable, Counter, Iterable, List
 from pprint import pprint
 
 import click
 from serde.json import from_json
-from harf_serde import Har, harf
-
-from harf.correlations.envs import (
-    post_data_env,
-    header_env,
-    cookie_env,
-    query_string_env,
-    content_env,
-    response_env,
-    request_env,
-    entry_env,
-    log_env,
-    Env,
-    Path,
-)
-from harf.correlations.obsidian import mk_obsidian, write_files
-from harf.grouping.by_comment import icomment_requests
-
-
-def filter_by_percentages(min_percent: float, max_percent: float, env: Env) -> Env:
-    max_reference_count = len(max(env.values(), key=len))
-    min_bound = int(max_reference_count * min_percent)
-    max_bound = int(max_reference_count * max_percent)
-    filtered_env = Env()
-    for v, ps in env.items():
-        if min_bound <= len(ps) <= max_bound:
-            filtered_env[v] = ps
-    return filtered_env
+from harf_serde import Har
+
+from harf.correlations.envs import path_values, Env, Path
+from harf.correlations.bodies import BodyFilter, BodyMemo, BodyStore, decoders
+from harf.correlations.columnar import ValueTable
+from harf.cache import (
+    cache_file,
+    default_cache_dir,
+    load_indexes,
+    prune_cache,
+    store_envs,
+)
+from harf.correlations.diff import diff_renderers
+from harf.correlations.filters import (
+    count_histogram,
+    filter_by_percentages,
+    reference_counts,
+    top_values,
+)
+from harf.correlations.obsidian import mk_obsidian, renders_body, write_files
+from harf.correlations.pipeline import (
+    StreamedEntries,
+    diff_hars,
+    entries_valued_envs,
+    request_valued_env,
+    response_valued_env,
+    runs_index,
+    sketch_entries,
+)
+from harf.correlations.render import (
+    histogram_renderers,
+    iter_text,
+    renderers,
+    write_env,
+)
+from harf.correlations.sketches import ReferenceSketch
+from harf.correlations.substrings import substring_env
+from harf.correlations.runs import run_renderers
+from harf.grouping.by_comment import comment_pages, icomment_requests
+from harf.profiling import Profiler
+from harf.streaming import iter_entries
 
 
 def str_env(
     env: Env, verbose=False, diffable=False, str_ref: Callable[[Path], str] = str
 ) -> str:
-    res = ""
-    for p, ps in env.items():
-        refs = list(map(str_ref, ps))
-        message = f"Value ({repr(p)}) used in:"
-        if diffable:
-            if len(refs) == 1:
-                continue
-            message = f"Value first seen at {refs[0]} used again in:"
-            refs = refs[1:]
-        res += f"{message}\n"
-        res += dumps(refs, indent=4).strip("[]").lstrip("\n")
-        res += "\n"
-    return res
-
-
-def request_valued_env(har: Har, headers: bool = False, cookies: bool = False) -> Env:
-    return harf(
-        post_data=post_data_env,
-        header=header_env if headers else None,
-        cookie=cookie_env if cookies else None,
-        querystring=query_string_env,
-        request=request_env,
-        entry=entry_env,
-        log=log_env,
-        default=Env(),
-    )(har)
-
-
-def response_valued_env(har: Har, headers: bool = False, cookies: bool = False) -> Env:
-    return harf(
-        header=header_env if headers else None,
-        cookie=cookie_env if cookies else None,
-        content=content_env,
-        response=response_env,
-        entry=entry_env,
-        log=log_env,
-        default=Env(),
-    )(har)
+    return "".join(iter_text(env, diffable, str_ref))
+
+
+def har_paths(patterns: Iterable[str]) -> List[str]:
+    """The har files of `patterns`, globs that are not a file are expanded in sorted order."""
+    paths = []
+    for pattern in patterns:
+        if pattern == "-" or os.path.isfile(pattern):
+            paths.append(pattern)
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise click.BadParameter(
+                    f"No files match {pattern!r}.", param_hint="HAR_FILES"
+                )
+            paths.extend(matches)
+        else:
+            raise click.BadParameter(
+                f"{pattern!r} is not a file.", param_hint="HAR_FILES"
+            )
+    return paths
+
+
+def env_counts(env: Env) -> dict:
+    return {"values": len(env), "paths": sum(map(len, env.values()))}
+
+
+def report_profile(profiler: Profiler, stats_file=None, trace_file=None) -> None:
+    click.echo(profiler.summary(), err=True)
+    if stats_file:
+        profiler.dump_stats(stats_file)
+    if trace_file:
+        profiler.dump_chrome_trace(trace_file)
 
 
 @click.command()
-@click.argument("har-file", type=click.File("r", encoding="utf-8-sig"))
+@click.argument("har-files", nargs=-1, required=True)
 @click.option(
     "--interactive",
     "-i",
@@ -130,9 +141,167 @@ def response_valued_env(har: Har, headers: bool = False, cookies: bool = False)
 @click.option(
     "--max-reference-percent", "-x", "max_percent", default=98, show_default=True
 )
+@click.option(
+    "--top",
+    "-t",
+    type=click.IntRange(min=1),
+    help="Only show the N most referenced values, after filtering by reference percent.",
+)
+@click.option(
+    "--histogram",
+    is_flag=True,
+    default=False,
+    help="Show how many values have each reference count instead of the values.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(list(renderers)),
+    default="text",
+    show_default=True,
+    help="Output format, jsonl and csv are meant to be read by other tools.",
+)
+@click.option(
+    "--output",
+    type=click.File("w", encoding="utf-8", lazy=True),
+    default="-",
+    help="Write the output to a file instead of stdout.",
+)
+@click.option(
+    "--substrings",
+    is_flag=True,
+    default=False,
+    help="Also link response values found inside of longer request strings, like tokens in headers.",
+)
+@click.option(
+    "--substring-min-length",
+    type=click.IntRange(min=1),
+    default=6,
+    show_default=True,
+    help="Only look for values with at least this many characters inside of strings.",
+)
+@click.option(
+    "--substring-min-entropy",
+    type=click.FloatRange(min=0),
+    default=2.5,
+    show_default=True,
+    help="Only look for values with at least this many bits of entropy per character inside of strings.",
+)
+@click.option(
+    "--diff",
+    is_flag=True,
+    default=False,
+    help="Show the values that differ between entries of the har files aligned by method and url.",
+)
+@click.option(
+    "--consumed-only",
+    is_flag=True,
+    default=False,
+    help="Only index response values that are used in a request, reads the har twice but keeps a lot less in memory.",
+)
+@click.option(
+    "--sketch",
+    is_flag=True,
+    default=False,
+    help="Count references approximately in a first pass over the har and only build the values that might be within -m/-x.",
+)
+@click.option(
+    "--sketch-epsilon",
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    default=0.001,
+    show_default=True,
+    help="How much counts can be over estimated by the sketch, relative to the number of references.",
+)
+@click.option(
+    "--sketch-delta",
+    type=click.FloatRange(min=0, max=1, min_open=True, max_open=True),
+    default=0.01,
+    show_default=True,
+    help="The probability of a count being over estimated by more than the epsilon.",
+)
 @click.option("--obsidian", "-o", type=click.Path(file_okay=False))
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Read the har one entry at a time to keep memory usage low, can not be used with -i or -o.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to find the values in entries.",
+)
+@click.option(
+    "--loose-types",
+    is_flag=True,
+    default=False,
+    help="Treat equal numbers and booleans of different types, like 1, 1.0 and true, as the same value.",
+)
+@click.option(
+    "--max-body-size",
+    type=click.IntRange(min=0),
+    help="Skip bodies longer than this many characters.",
+)
+@click.option(
+    "--ignore-mime-type",
+    "ignore_mime_types",
+    multiple=True,
+    help="Skip bodies whose mime type matches this glob, e.g. 'application/vnd.*'. Can be repeated.",
+)
+@click.option(
+    "--ignore-url",
+    "ignore_urls",
+    multiple=True,
+    help="Skip the bodies of entries whose url matches this glob, e.g. '*/analytics/*'. Can be repeated.",
+)
+@click.option(
+    "--body-memo-size",
+    type=click.IntRange(min=0),
+    default=1024,
+    show_default=True,
+    help="How many distinct bodies to remember so repeated bodies are only decoded once, 0 to turn it off.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Always build the envs from the har instead of loading them from the cache.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=default_cache_dir,
+    show_default="$XDG_CACHE_HOME/harf",
+    help="Where the envs built from har files are cached.",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=1024,
+    show_default=True,
+    help="How many MiB the cache may take, the least recently used envs are removed past it.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print the time, memory and item counts of every stage to stderr.",
+)
+@click.option(
+    "--profile-stats",
+    type=click.Path(dir_okay=False),
+    help="Run every stage under cProfile and write the pstats to this file, implies --profile.",
+)
+@click.option(
+    "--profile-trace",
+    type=click.Path(dir_okay=False),
+    help="Write the stages to this file as a Chrome trace, implies --profile.",
+)
 def correlations(
-    har_file,
+    har_files,
     interactive,
     diffable,
     headers,
@@ -140,13 +309,231 @@ def correlations(
     verbose,
     min_percent,
     max_percent,
+    top,
+    histogram,
+    output_format,
+    output,
+    substrings,
+    substring_min_length,
+    substring_min_entropy,
+    diff,
+    consumed_only,
+    sketch,
+    sketch_epsilon,
+    sketch_delta,
     obsidian,
+    stream,
+    jobs,
+    loose_types,
+    max_body_size,
+    ignore_mime_types,
+    ignore_urls,
+    body_memo_size,
+    no_cache,
+    cache_dir,
+    cache_size,
+    profile,
+    profile_stats,
+    profile_trace,
 ):
-    har = from_json(Har, har_file.read())
-    icomment_requests(har.log)
-    request_values = request_valued_env(har)
-    response_values = response_valued_env(har)
-    env = request_values + response_values
+    if stream and (interactive or obsidian):
+        raise click.UsageError(
+            "--stream can not be used with --interactive or --obsidian."
+        )
+    profiler = Profiler(cprofile=bool(profile_stats))
+    if profile or profile_stats or profile_trace:
+        click.get_current_context().call_on_close(
+            partial(report_profile, profiler, profile_stats, profile_trace)
+        )
+
+    bodies = BodyFilter(max_body_size, ignore_mime_types, ignore_urls)
+    paths = har_paths(har_files)
+    if diff and len(paths) < 2:
+        raise click.UsageError("--diff needs at least two har files.")
+    if len(paths) > 1:
+        if interactive or obsidian or histogram or top or consumed_only or sketch:
+            raise click.UsageError(
+                "--interactive, --obsidian, --histogram, --top, --consumed-only and --sketch only work on a single har file."
+            )
+    if consumed_only and (interactive or substrings):
+        raise click.UsageError(
+            "--consumed-only can not be used with --interactive or --substrings, they need every response value."
+        )
+    if sketch and (interactive or substrings or histogram):
+        raise click.UsageError(
+            "--sketch can not be used with --interactive, --substrings or --histogram, they need every value."
+        )
+    # Without filtering every value is a candidate, there is nothing to sketch.
+    sketch = sketch and (min_percent > 0 or max_percent < 100)
+    if diff:
+        with profiler.stage("diff") as stage:
+            diffs = diff_hars(
+                paths,
+                jobs,
+                headers=headers,
+                cookies=cookies,
+                loose_types=loose_types,
+                bodies=bodies,
+                stream=stream,
+                memo_size=body_memo_size,
+            )
+            stage.counts["hars"] = len(paths)
+        with profiler.stage("render") as stage:
+            stage.counts["chars"] = sum(
+                map(output.write, diff_renderers[output_format](paths, diffs))
+            )
+        return
+    if len(paths) > 1:
+        with profiler.stage("runs") as stage:
+            index = runs_index(
+                paths,
+                jobs,
+                headers=headers,
+                cookies=cookies,
+                loose_types=loose_types,
+                bodies=bodies,
+                stream=stream,
+                memo_size=body_memo_size,
+                min_percent=min_percent / 100,
+                max_percent=max_percent / 100,
+                verbose=verbose,
+            )
+            stage.counts["runs"] = len(paths)
+            stage.counts["values"] = len(index.keys)
+        with profiler.stage("render") as stage:
+            stage.counts["chars"] = sum(
+                map(output.write, run_renderers[output_format](index))
+            )
+        return
+    har_file = click.File("r", encoding="utf-8-sig").convert(
+        paths[0], None, click.get_current_context()
+    )
+    cache = None
+    cached = None
+    store = None
+    if not no_cache and not sketch and os.path.isfile(har_file.name):
+        with profiler.stage("load cache") as stage:
+            # Headers and cookies are in the key, they can not be dropped after loading. Values
+            # are ordered by where they are first seen and a value first seen in a header would
+            # need its place in a later entry, which the cached index does not keep.
+            cache = cache_file(
+                cache_dir,
+                har_file.name,
+                headers=headers,
+                cookies=cookies,
+                loose_types=loose_types,
+                bodies=dataclasses.astuple(bodies),
+                decoders=sorted(decoders),
+                consumed_only=consumed_only,
+            )
+            cached = load_indexes(cache)
+            stage.counts["hit"] = int(cached is not None)
+
+    if stream and (consumed_only or sketch):
+        if not har_file.seekable():
+            raise click.UsageError(
+                "--consumed-only and --sketch can only stream seekable files."
+            )
+        entries = StreamedEntries(har_file)
+    elif stream:
+        # Entries are read and re-paged as the envs are built.
+        entries = comment_pages(iter_entries(har_file), [])
+    elif cached is None or interactive or obsidian:
+        with profiler.stage("parse") as stage:
+            har = from_json(Har, har_file.read())
+            stage.counts["entries"] = len(har.log.entries)
+        with profiler.stage("comment pages") as stage:
+            icomment_requests(har.log)
+            stage.counts["entries"] = len(har.log.entries)
+            stage.counts["pages"] = len(har.log.pages or [])
+        entries = har.log.entries
+
+    if cached is None:
+        memo = BodyMemo(body_memo_size)
+        candidates = None
+        if sketch:
+            with profiler.stage("sketch") as stage:
+                reference_sketch = sketch_entries(
+                    entries,
+                    headers,
+                    cookies,
+                    loose_types,
+                    jobs,
+                    bodies=bodies,
+                    memo=memo,
+                    sketch=ReferenceSketch(sketch_epsilon, sketch_delta),
+                )
+                bounds = reference_sketch.bounds(min_percent / 100, max_percent / 100)
+                candidates = reference_sketch.candidates(
+                    min_percent / 100, max_percent / 100
+                )
+                stage.counts.update(bounds._asdict())
+            click.echo(
+                f"Sketched {bounds.references} references of about {bounds.distinct} "
+                f"distinct values (±{bounds.distinct_error:.1%}), the most referenced value "
+                f"has at most {bounds.max_count} references. Counts are over estimated by at "
+                f"most {bounds.error} with a probability of {1 - sketch_delta:.0%}, only "
+                f"values with {bounds.min_count} to {bounds.max_count_bound} references are "
+                "built.",
+                err=True,
+            )
+        with profiler.stage("envs") as stage:
+            skipped: Counter[str] = collections.Counter()
+            if obsidian:
+                # The bodies the obsidian export renders, so they are not decoded twice.
+                store = BodyStore(renders_body)
+            request_values, response_values, urls = entries_valued_envs(
+                entries,
+                headers,
+                cookies,
+                loose_types,
+                jobs,
+                bodies=bodies,
+                skipped=skipped,
+                memo=memo,
+                store=store,
+                consumed_only=consumed_only,
+                keep=candidates,
+            )
+            stage.counts["entries"] = len(urls)
+            stage.counts.update(
+                (f"skipped {reason}", count) for reason, count in skipped.items()
+            )
+            stage.counts["body memo hits"] = memo.hits
+            stage.counts["body memo misses"] = memo.misses
+        if skipped:
+            reasons = ", ".join(
+                f"{count} by {reason}" for reason, count in sorted(skipped.items())
+            )
+            click.echo(f"Skipped bodies: {reasons}.", err=True)
+        if memo.hits:
+            click.echo(
+                f"Decoded {memo.misses} bodies, {memo.hits} repeated bodies were reused "
+                f"({memo.hit_rate():.0%} hit rate).",
+                err=True,
+            )
+        if cache:
+            with profiler.stage("store cache"):
+                store_envs(cache, request_values, response_values, urls)
+                prune_cache(cache.parent, cache_size << 20, keep=cache)
+    else:
+        request_index, response_index, urls = cached
+        table = ValueTable()
+        request_values = table.add_index(request_index).view()
+        response_values = table.add_index(response_index).view()
+    if substrings:
+        with profiler.stage("substrings") as stage:
+            found = substring_env(
+                request_values,
+                response_values,
+                substring_min_length,
+                substring_min_entropy,
+            )
+            request_values = request_values | request_values.env.table.add(found).view()
+            stage.counts.update(env_counts(found))
+    with profiler.stage("join envs") as stage:
+        env = request_values + response_values
+        stage.counts.update(env_counts(env))
     if interactive:
         code.interact(
             local={
@@ -156,28 +543,56 @@ def correlations(
                     filter_by_percentages, min_percent / 100, max_percent / 100
                 ),
                 "str_env": str_env,
+                "top_values": top_values,
+                "count_histogram": lambda env: count_histogram(reference_counts(env)),
                 "unused_values": response_values - request_values,
+                "value_at": path_values(env),
             }
         )
         return
+    if histogram:
+        with profiler.stage("histogram") as stage:
+            counts = count_histogram(reference_counts(env))
+            stage.counts["counts"] = len(counts)
+        with profiler.stage("render") as stage:
+            stage.counts["chars"] = sum(
+                map(output.write, histogram_renderers[output_format](counts))
+            )
+        return
     if min_percent > 0 or max_percent < 100:
-        env = filter_by_percentages(min_percent / 100, max_percent / 100, env)
+        with profiler.stage("filter") as stage:
+            env = filter_by_percentages(min_percent / 100, max_percent / 100, env)
+            stage.counts.update(env_counts(env))
+    if top:
+        with profiler.stage("top") as stage:
+            env = top_values(env, top)
+            stage.counts.update(env_counts(env))
     if verbose:
-        to_ref = (
-            lambda p: har.log.entries[p.index].request.url
-            + " "
-            + str(p.next_).lstrip(".")
-        )
+        to_ref = lambda p: urls[p.index] + " " + str(p.next_).lstrip(".")
     else:
         to_ref = str
     if obsidian:
         obsidian = pathlib.Path(obsidian)
         out_dir = obsidian / pathlib.Path(har_file.name).stem
-        (out_dir / ".obsidian" / "snippets").mkdir(parents=True, exist_ok=True)
-        obsidian_data = mk_obsidian(env, har)
-        write_files(obsidian_data, out_dir)
+        with profiler.stage("obsidian") as stage:
+            obsidian_data = mk_obsidian(env, har, store)
+            stage.counts["files"] = len(obsidian_data)
+        with profiler.stage("write") as stage:
+            stats = write_files(obsidian_data, out_dir)
+            stage.counts["written"] = stats.written
+            stage.counts["skipped"] = stats.skipped
+        click.echo(
+            f"Wrote {stats.written} files ({stats.bytes_written} bytes), "
+            f"skipped {stats.skipped} unchanged files.",
+            err=True,
+        )
     else:
-        print(str_env(env, verbose, diffable, to_ref))
+        with profiler.stage("render") as stage:
+            stage.counts["chars"] = write_env(
+                env, output, output_format, diffable, to_ref
+            )
+            if output_format == "text":
+                output.write("\n")
 
 
 if __name__ == "__main__":
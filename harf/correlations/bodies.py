@@ -0,0 +1,307 @@
+"""Decoding of request and response bodies.
+
+Bodies are decoded into json like values by the decoder registered for their mime type, so every
+kind of body gets the same paths from `json_env`. Json bodies are decoded with `orjson` when it is
+installed, falling back to `json` for what `orjson` rejects, like `NaN`. `orjson` turns integers
+outside of 64 bits into floats, checking the decoded values for those is a lot cheaper than
+searching every body for long runs of digits. A `BodyFilter` skips bodies that are not worth
+decoding at all, e.g. multi-MB analytics blobs that never hold a correlated value. A `BodyMemo`
+keeps what was made of recently seen bodies, so the same body repeated by polled or paginated
+endpoints is only decoded once, and a `BodyStore` keeps decoded bodies around for rendering them
+later without decoding them again.
+
+More decoders can be registered with `register_decoder`:
+
+    @register_decoder("application/yaml")
+    def decode_yaml(text, mime_type, loads):
+        return yaml.safe_load(text)
+"""
+
+import hashlib
+import io
+import json
+from collections import OrderedDict
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from email.parser import BytesParser
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import parse_qsl
+
+from harf.jsonf import Json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover, orjson is optional
+    orjson = None
+
+T = TypeVar("T")
+
+
+def loads(text: Union[str, bytes]) -> Json:
+    """Decodes json, integers outside of 64 bits might be rounded to floats, see `maybe_rounded`."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def maybe_rounded(value: Json) -> bool:
+    """If `value` might be an integer `loads` rounded, these need to be decoded with `json`."""
+    return (
+        orjson is not None
+        and isinstance(value, float)
+        and abs(value) >= 2**63
+        and value.is_integer()
+    )
+
+
+# Decodes a body with a mime type, decoding any json in it with the given function.
+Decoder = Callable[[Union[str, bytes], str, Callable[[Union[str, bytes]], Json]], Json]
+
+decoders: Dict[str, Decoder] = {}
+
+
+@lru_cache(maxsize=None)
+def decoder_for(mime_type: str) -> Optional[Decoder]:
+    """The decoder of `mime_type`, ignoring its parameters.
+
+    Mime types with a structured syntax suffix, like `application/soap+xml`, without a decoder of
+    their own use the decoder of their suffix.
+    """
+    base = mime_type.split(";", 1)[0].strip().lower()
+    decoder = decoders.get(base)
+    if decoder is None and "+" in base:
+        decoder = decoders.get("application/" + base.rsplit("+", 1)[1])
+    return decoder
+
+
+def register_decoder(*mime_types: str) -> Callable[[Decoder], Decoder]:
+    def register(decoder: Decoder) -> Decoder:
+        for mime_type in mime_types:
+            decoders[mime_type.lower()] = decoder
+        decoder_for.cache_clear()
+        return decoder
+
+    return register
+
+
+def _text(text: Union[str, bytes]) -> str:
+    return text.decode("utf-8", "replace") if isinstance(text, bytes) else text
+
+
+def _group(items: Iterable[Tuple[str, Json]]) -> Dict[str, Json]:
+    """An object of `items`, the values of repeated names are lists."""
+    res: Dict[str, Json] = {}
+    repeated = set()
+    for name, value in items:
+        if name not in res:
+            res[name] = value
+        elif name in repeated:
+            res[name].append(value)
+        else:
+            res[name] = [res[name], value]
+            repeated.add(name)
+    return res
+
+
+@register_decoder("application/json")
+def decode_json(text, mime_type, loads=loads) -> Json:
+    return loads(text)
+
+
+@register_decoder("application/x-www-form-urlencoded")
+def decode_form(text, mime_type, loads=loads) -> Json:
+    """The fields of a form by name."""
+    return _group(parse_qsl(_text(text), keep_blank_values=True))
+
+
+def _local(name: str) -> str:
+    return name.rsplit("}", 1)[-1]
+
+
+@register_decoder("application/xml", "text/xml")
+def decode_xml(text, mime_type, loads=loads) -> Json:
+    """An object of the root element.
+
+    Elements are objects of their attributes, named `@name`, child elements and text, named
+    `#text`, or just their text if they have neither attributes nor children. Namespaces are left
+    out of names. The body is read with `iterparse` and every element is cleared once it is
+    decoded, so no tree of the whole document is built.
+    """
+    data = text.encode() if isinstance(text, str) else text
+    children: List[List[Tuple[str, Json]]] = [[]]
+    for event, element in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+        if event == "start":
+            children.append([])
+            continue
+        items = [("@" + _local(k), v) for k, v in element.attrib.items()]
+        items.extend(children.pop())
+        element_text = (element.text or "").strip()
+        if items and element_text:
+            items.append(("#text", element_text))
+        children[-1].append(
+            (_local(element.tag), _group(items) if items else element_text)
+        )
+        element.clear()
+    return _group(children[0])
+
+
+@register_decoder("multipart/form-data", "multipart/mixed", "multipart/related")
+def decode_multipart(text, mime_type, loads=loads) -> Json:
+    """The parts by name, or position if they have none.
+
+    Parts are decoded by the decoder of their content type, parts without one are kept as text
+    unless they are a file.
+    """
+    data = text.encode("utf-8", "surrogateescape") if isinstance(text, str) else text
+    message = BytesParser().parsebytes(
+        f"Content-Type: {mime_type}\r\n\r\n".encode() + data
+    )
+    if not message.is_multipart():
+        return {}
+    parts = []
+    for i, part in enumerate(message.get_payload()):
+        name = part.get_param("name", header="content-disposition") or str(i)
+        payload = part.get_payload(decode=True) or b""
+        content_type = part.get("content-type", "text/plain")
+        decoder = decoder_for(content_type)
+        if decoder is not None:
+            parts.append((name, decoder(payload, content_type, loads)))
+        elif part.get_filename() is None and part.get_content_maintype() == "text":
+            charset = part.get_content_charset() or "utf-8"
+            parts.append((name, payload.decode(charset, "replace")))
+    return _group(parts)
+
+
+@dataclass(frozen=True)
+class BodyFilter:
+    """Which bodies are decoded.
+
+    Bodies longer than `max_size` characters or with a mime type matching one of the
+    `ignore_mime_types` globs are skipped. The bodies of entries whose url matches one of the
+    `ignore_urls` globs are skipped by `entries_valued_envs`, which sees each entry's url.
+    """
+
+    max_size: Optional[int] = None
+    ignore_mime_types: Tuple[str, ...] = ()
+    ignore_urls: Tuple[str, ...] = ()
+
+    def skip_reason(self, mime_type: str, text: Union[str, bytes]) -> Optional[str]:
+        if self.max_size is not None and len(text) > self.max_size:
+            return "size"
+        mime_type = mime_type.lower()
+        if any(fnmatchcase(mime_type, p.lower()) for p in self.ignore_mime_types):
+            return "mime type"
+        return None
+
+    def skip_url(self, url: str) -> bool:
+        return any(fnmatchcase(url, p) for p in self.ignore_urls)
+
+
+no_filter = BodyFilter()
+
+
+def body_key(text: Union[str, bytes], *details: Hashable) -> Tuple[Hashable, ...]:
+    """The key of a body, `details` are everything else what is made of it depends on.
+
+    Bodies are keyed by a 128 bit blake2b digest instead of their text, so keys do not keep the
+    bodies themselves alive.
+    """
+    data = text.encode("utf-8", "surrogatepass") if isinstance(text, str) else text
+    return (hashlib.blake2b(data, digest_size=16).digest(), *details)
+
+
+class BodyMemo:
+    """What was made of the last `maxsize` distinct bodies, by their `body_key`.
+
+    A `maxsize` of 0 turns the memo off. What is made of a body depends on the values to keep, see
+    `use_keep`.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.items: "OrderedDict[Hashable, object]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.keep: Optional[Container] = None
+
+    def use_keep(self, keep: Optional[Container]) -> None:
+        """Forgets everything made with other values to keep, once `keep` changes.
+
+        The memo holds on to `keep`, filters are compared by identity and are usually unhashable.
+        """
+        if keep is not self.keep:
+            self.items.clear()
+            self.keep = keep
+
+    def get(self, key: Hashable, make: Callable[[], T]) -> T:
+        """The value of `key`, made by `make` if it is not in the memo."""
+        value = self.items.get(key)
+        if value is not None:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return value
+        self.misses += 1
+        value = make()
+        if self.maxsize:
+            self.items[key] = value
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class BodyStore:
+    """Decoded bodies kept to be rendered, by their `body_key`.
+
+    Only bodies `keep` returns true for are stored, it is called with their mime type and if they
+    are a request body. Every copy of a body is counted and the body is freed once its last copy
+    is taken.
+    """
+
+    def __init__(
+        self, keep: Callable[[str, bool], bool] = lambda mime_type, request: True
+    ):
+        self.keep = keep
+        self.bodies: Dict[Hashable, Json] = {}
+        self.counts: Dict[Hashable, int] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.counts
+
+    def add(self, key: Hashable, body: Json) -> None:
+        """Adds a copy of a body, or counts it if the body is already stored."""
+        if key in self.counts:
+            self.counts[key] += 1
+        else:
+            self.bodies[key] = body
+            self.counts[key] = 1
+
+    def take(self, key: Hashable, make: Callable[[], Json]) -> Json:
+        """A copy of the body of `key`, made by `make` if it was not stored."""
+        count = self.counts.get(key)
+        if count is None:
+            return make()
+        if count > 1:
+            self.counts[key] = count - 1
+            return self.bodies[key]
+        del self.counts[key]
+        return self.bodies.pop(key)
@@ -0,0 +1,344 @@
+"""`Env`s as parallel arrays of value ids and path rows.
+
+A `ValueTable` interns values to integer ids in the order they are first added and stores every
+path once. A `ColumnarEnv` of the table is then parallel arrays of the value id, table row and rank
+of each of its paths, sorted by value id. Set operations between envs of the same table are merges
+of sorted arrays, done with numpy when it is installed, and never build per value lists.
+
+The rank of a path is its position in the `Env` the columnar env stands for, so
+`ColumnarEnv.view`, a read-only `Env` like mapping, iterates values in the same order as the
+`Env` operations would.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right, bisect
+from collections.abc import ItemsView, ValuesView
+from itertools import chain, repeat
+from typing import Dict, Hashable, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+from harf.correlations.envs import Env
+from harf.correlations.index import EnvIndex
+from harf.correlations.paths import Path
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover, numpy is optional
+    np = None
+
+
+# The value ids, table rows and ranks of paths.
+Columns = Tuple[Sequence[int], Sequence[int], Sequence[int]]
+
+
+def _ints() -> Sequence[int]:
+    if np is not None:
+        return np.empty(0, dtype=np.int64)
+    return array("q")
+
+
+def _range(start: int, stop: int) -> Sequence[int]:
+    if np is not None:
+        return np.arange(start, stop, dtype=np.int64)
+    return array("q", range(start, stop))
+
+
+def _repeat(ids: List[int], counts: List[int]) -> Sequence[int]:
+    if np is not None:
+        return np.repeat(np.array(ids, dtype=np.int64), counts)
+    return array("q", chain.from_iterable(map(repeat, ids, counts)))
+
+
+def _concat(*parts: Sequence[int]) -> Sequence[int]:
+    if np is not None:
+        return np.concatenate((_ints(), *parts))
+    res = array("q")
+    for part in parts:
+        res.extend(part)
+    return res
+
+
+def _after(ints: Sequence[int], other: Sequence[int]) -> Sequence[int]:
+    """`other` shifted to start after the largest of `ints`."""
+    if not len(ints):
+        return other
+    if np is not None:
+        return other + (int(ints.max()) + 1)
+    offset = max(ints) + 1
+    return array("q", (i + offset for i in other))
+
+
+def _take(ints: Sequence[int], indexes: Sequence[int]) -> Sequence[int]:
+    if np is not None:
+        return ints[indexes]
+    return array("q", map(ints.__getitem__, indexes))
+
+
+def _list(ints: Sequence[int]) -> List[int]:
+    return ints if isinstance(ints, list) else ints.tolist()
+
+
+def _argsort(ints: Sequence[int]) -> Sequence[int]:
+    """The stable sort order of `ints`, already sorted runs are merged in linear time."""
+    if np is not None:
+        return np.argsort(ints, kind="stable")
+    return sorted(range(len(ints)), key=ints.__getitem__)
+
+
+def _sort(columns: Columns) -> Columns:
+    order = _argsort(columns[0])
+    return tuple(_take(column, order) for column in columns)
+
+
+def _keep(columns: Columns, ids: Sequence[int], invert: bool) -> Columns:
+    """The paths whose value id is in `ids`, or not in `ids` when `invert`."""
+    value_ids = columns[0]
+    if np is not None:
+        keep = np.isin(value_ids, ids, invert=invert)
+    else:
+        ids = set(ids)
+        keep = [i for i, v in enumerate(value_ids) if (v in ids) is not invert]
+    return tuple(_take(column, keep) for column in columns)
+
+
+def _span(value_ids: Sequence[int], i: int) -> Tuple[int, int]:
+    """The start and end of the paths of value id `i`."""
+    if np is not None:
+        return tuple(np.searchsorted(value_ids, [i, i + 1]).tolist())
+    return bisect_left(value_ids, i), bisect_right(value_ids, i)
+
+
+def _group_starts(value_ids: Sequence[int]) -> List[int]:
+    """The index of the first path of every value, followed by the number of paths."""
+    if not len(value_ids):
+        return [0]
+    if np is not None:
+        starts = np.flatnonzero(np.diff(value_ids)) + 1
+        return [0, *starts.tolist(), len(value_ids)]
+    starts = [0]
+    starts.extend(
+        i for i in range(1, len(value_ids)) if value_ids[i] != value_ids[i - 1]
+    )
+    starts.append(len(value_ids))
+    return starts
+
+
+class _IndexPaths(Sequence[Path]):
+    def __init__(self, index: EnvIndex):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index.path_offsets) - 1
+
+    def __getitem__(self, j):
+        return self.index.path(j)
+
+
+class ValueTable:
+    """The values and paths shared by the `ColumnarEnv`s added to it."""
+
+    def __init__(self):
+        self.ids: Dict[Hashable, int] = {}
+        self.values: List[Hashable] = []
+        self.sources: List[Sequence[Path]] = []
+        self.source_starts: List[int] = []
+        self.rows = 0
+
+    def _ids(self, values: Iterable[Hashable]) -> List[int]:
+        """The ids of the distinct `values`, interning the ones that are new."""
+        ids = self.ids
+        new = [value for value in values if value not in ids]
+        ids.update(zip(new, range(len(self.values), len(self.values) + len(new))))
+        self.values.extend(new)
+        return list(map(ids.__getitem__, values))
+
+    def _add_source(self, paths: Sequence[Path]) -> int:
+        start = self.rows
+        self.sources.append(paths)
+        self.source_starts.append(start)
+        self.rows += len(paths)
+        return start
+
+    def columns(self, env: Env) -> Columns:
+        """Adds the values and paths of `env`, returning their unsorted columns.
+
+        Paths are ranked by their table row.
+        """
+        value_ids = _repeat(self._ids(env), list(map(len, env.values())))
+        start = self._add_source(list(chain.from_iterable(env.values())))
+        rows = _range(start, self.rows)
+        return value_ids, rows, rows
+
+    def env(self, columns: Iterable[Columns]) -> "ColumnarEnv":
+        """The env of all paths in `columns`, as if their `Env`s were merged in order."""
+        parts = list(zip(*columns)) or [(), (), ()]
+        return ColumnarEnv(self, *_sort(tuple(_concat(*part) for part in parts)))
+
+    def add(self, env: Env) -> "ColumnarEnv":
+        """Adds the values and paths of `env`."""
+        return self.env([self.columns(env)])
+
+    def add_index(self, index: EnvIndex) -> "ColumnarEnv":
+        """Adds the values and paths of `index`, its paths are only decoded once they are used."""
+        counts = list(map(index.count, range(len(index.values))))
+        value_ids = _repeat(self._ids(index.values), counts)
+        start = self._add_source(_IndexPaths(index))
+        rows = _range(start, self.rows)
+        return self.env([(value_ids, rows, rows)])
+
+    def path(self, row: int) -> Path:
+        source = bisect(self.source_starts, row) - 1
+        return self.sources[source][row - self.source_starts[source]]
+
+
+class ColumnarEnv:
+    """The paths of an env as parallel `value_ids`, table `rows` and `ranks`, sorted by value id."""
+
+    def __init__(
+        self,
+        table: ValueTable,
+        value_ids: Sequence[int],
+        rows: Sequence[int],
+        ranks: Sequence[int],
+    ):
+        self.table = table
+        self.value_ids = value_ids
+        self.rows = rows
+        self.ranks = ranks
+
+    @property
+    def columns(self) -> Columns:
+        return self.value_ids, self.rows, self.ranks
+
+    def _check_table(self, other: "ColumnarEnv") -> None:
+        if other.table is not self.table:
+            raise ValueError("Columnar envs have to share a ValueTable to be combined.")
+
+    def _after(self, other: "ColumnarEnv") -> Columns:
+        """The columns of `other` ranked after every path of `self`."""
+        self._check_table(other)
+        return other.value_ids, other.rows, _after(self.ranks, other.ranks)
+
+    def __add__(self, other: "ColumnarEnv") -> "ColumnarEnv":
+        """The values of `self` with the paths of both envs."""
+        other_columns = _keep(self._after(other), self.value_ids, False)
+        return self.table.env([self.columns, other_columns])
+
+    def __sub__(self, other: "ColumnarEnv") -> "ColumnarEnv":
+        """The values of `self` that are not in `other`."""
+        self._check_table(other)
+        return ColumnarEnv(self.table, *_keep(self.columns, other.value_ids, True))
+
+    def __or__(self, other: "ColumnarEnv") -> "ColumnarEnv":
+        """The values of both envs with the paths of both envs."""
+        return self.table.env([self.columns, self._after(other)])
+
+    def view(self) -> "EnvView":
+        return EnvView(self)
+
+
+class Rows(Sequence[Path]):
+    """The paths of a value in an `EnvView`, looked up in the table when they are used."""
+
+    __slots__ = ("table", "rows")
+
+    def __init__(self, table: ValueTable, rows: Sequence[int]):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(map(self.table.path, _list(self.rows[i])))
+        return self.table.path(int(self.rows[i]))
+
+    def __iter__(self) -> Iterator[Path]:
+        return map(self.table.path, _list(self.rows))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (Rows, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._items()
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        return (paths for _, paths in self._mapping._items())
+
+
+class EnvView(Mapping[Hashable, Rows]):
+    """A read-only `Env` of a `ColumnarEnv`.
+
+    `+`, `-` and `|` between views of the same table are the `ColumnarEnv` operations.
+    """
+
+    def __init__(self, env: ColumnarEnv):
+        self.env = env
+        self.starts = _group_starts(env.value_ids)
+        # The groups of paths of every value, in the order of the rank of their first path.
+        self.order = _list(_argsort(_take(env.ranks, self.starts[:-1])))
+
+    def _value_ids(self) -> List[int]:
+        value_ids = _take(self.env.value_ids, self.starts[:-1])
+        return _list(_take(value_ids, self.order))
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def counts(self) -> List[int]:
+        """The number of paths of every value, in the order of the view."""
+        starts = self.starts
+        return [starts[g + 1] - starts[g] for g in self.order]
+
+    def __iter__(self):
+        return map(self.env.table.values.__getitem__, self._value_ids())
+
+    def __getitem__(self, value) -> Rows:
+        i = self.env.table.ids[value]
+        lo, hi = _span(self.env.value_ids, i)
+        if lo == hi:
+            raise KeyError(value)
+        return Rows(self.env.table, self.env.rows[lo:hi])
+
+    def _items(self) -> Iterator[Tuple[Hashable, Rows]]:
+        table = self.env.table
+        rows = self.env.rows
+        starts = self.starts
+        for g, value_id in zip(self.order, self._value_ids()):
+            yield table.values[value_id], Rows(table, rows[starts[g] : starts[g + 1]])
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def __add__(self, other):
+        if not isinstance(other, EnvView):
+            return NotImplemented
+        return (self.env + other.env).view()
+
+    def __sub__(self, other):
+        if not isinstance(other, EnvView):
+            return NotImplemented
+        return (self.env - other.env).view()
+
+    def __or__(self, other):
+        if not isinstance(other, EnvView):
+            return NotImplemented
+        return (self.env | other.env).view()
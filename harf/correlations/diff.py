@@ -0,0 +1,151 @@
+"""Values that differ between recordings of the same flow.
+
+Entries of the recordings are aligned by a fingerprint of their method and url template, the url
+path with every segment holding a digit, like ids, replaced by `{}`. The `k`th entry with a
+fingerprint in one recording is aligned with the `k`th entry with the same fingerprint in the
+others, which takes one pass over every recording. The values found at the same place in aligned
+entries are then compared, the ones that differ are session tokens, ids, nonces and other values a
+script has to correlate instead of replaying.
+"""
+
+import csv
+import hashlib
+import io
+from dataclasses import dataclass
+from json import dumps
+from typing import Dict, Hashable, Iterator, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from harf.correlations.envs import plain_value
+from harf.correlations.paths import Path
+from harf.correlations.render import csv_value
+
+# The value at every place, like `response.body.token`, of every entry.
+EntryValues = Dict[int, Dict[str, Hashable]]
+
+
+def url_template(url: str) -> str:
+    """The host and path of `url` with the segments holding a digit replaced by `{}`."""
+    parts = urlparse(url)
+    segments = [
+        "{}" if any(c.isdigit() for c in segment) else segment
+        for segment in parts.path.split("/")
+    ]
+    return parts.netloc + "/".join(segments)
+
+
+def request_template(method: str, url: str) -> str:
+    return f"{method.upper()} {url_template(url)}"
+
+
+def fingerprint(template: str) -> int:
+    """A hash of a `request_template`, the same in every process."""
+    digest = hashlib.blake2b(template.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def entry_values(env: Mapping[Hashable, Sequence[Path]]) -> EntryValues:
+    """The values of `env` by entry and their place in the entry."""
+    values: EntryValues = {}
+    for value, paths in env.items():
+        for path in paths:
+            values.setdefault(path.index, {})[str(path.next_).lstrip(".")] = value
+    return values
+
+
+def align(fingerprints: Sequence[Sequence[int]]) -> List[List[Optional[int]]]:
+    """The indexes of aligned entries in every recording, `None` where one has no such entry.
+
+    Aligned entries are in the order they are first seen in the recordings.
+    """
+    rows: Dict[Tuple[int, int], List[Optional[int]]] = {}
+    for recording, entries in enumerate(fingerprints):
+        seen: Dict[int, int] = {}
+        for index, entry in enumerate(entries):
+            occurrence = seen[entry] = seen.get(entry, -1) + 1
+            row = rows.get((entry, occurrence))
+            if row is None:
+                row = rows[(entry, occurrence)] = [None] * len(fingerprints)
+            row[recording] = index
+    return list(rows.values())
+
+
+@dataclass(frozen=True)
+class Difference:
+    """The values at `place` of aligned entries that are not all the same.
+
+    `recordings`, `entries` and `values` are parallel, recordings without a value at `place` are
+    left out.
+    """
+
+    request: str
+    place: str
+    recordings: Tuple[int, ...]
+    entries: Tuple[int, ...]
+    values: Tuple[Hashable, ...]
+
+
+def differences(
+    templates: Sequence[Sequence[str]],
+    alignment: List[List[Optional[int]]],
+    recordings: Sequence[EntryValues],
+) -> Iterator[Difference]:
+    """The places of aligned entries whose values differ between at least two recordings.
+
+    `templates` are the `request_template`s of the entries of every recording.
+    """
+    for row in alignment:
+        present = [(r, i) for r, i in enumerate(row) if i is not None]
+        request = templates[present[0][0]][present[0][1]]
+        entries = [(r, i, recordings[r].get(i, {})) for r, i in present]
+        places = dict.fromkeys(place for _, _, values in entries for place in values)
+        for place in places:
+            found = [
+                (r, i, values[place]) for r, i, values in entries if place in values
+            ]
+            if len(found) > 1 and any(v != found[0][2] for _, _, v in found):
+                yield Difference(request, place, *map(tuple, zip(*found)))
+
+
+def iter_diff_text(names: Sequence[str], diffs: Iterator[Difference]) -> Iterator[str]:
+    for diff in diffs:
+        lines = "\n".join(
+            f"    {names[r]} entry_{entry}: ({repr(value)})"
+            for r, entry, value in zip(diff.recordings, diff.entries, diff.values)
+        )
+        yield f"Value of {diff.request} {diff.place} differs:\n{lines}\n\n"
+
+
+def iter_diff_jsonl(names: Sequence[str], diffs: Iterator[Difference]) -> Iterator[str]:
+    for diff in diffs:
+        record = {
+            "request": diff.request,
+            "place": diff.place,
+            "values": [
+                {"har": names[r], "entry": entry, "value": plain_value(value)}
+                for r, entry, value in zip(diff.recordings, diff.entries, diff.values)
+            ],
+        }
+        yield dumps(record) + "\n"
+
+
+def iter_diff_csv(names: Sequence[str], diffs: Iterator[Difference]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["request", "place", "har", "entry", "value"])
+    yield buffer.getvalue()
+    for diff in diffs:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (diff.request, diff.place, names[r], entry, csv_value(value))
+            for r, entry, value in zip(diff.recordings, diff.entries, diff.values)
+        )
+        yield buffer.getvalue()
+
+
+diff_renderers = {
+    "text": iter_diff_text,
+    "jsonl": iter_diff_jsonl,
+    "csv": iter_diff_csv,
+}
@@ -1,12 +1,28 @@
 from collections import defaultdict
-from functools import partial, reduce
-from typing import List, Dict, Callable, TypeVar, Generic
+from functools import partial
+from itertools import chain
+from typing import (
+    Container,
+    Counter,
+    List,
+    Dict,
+    Callable,
+    TypeVar,
+    Generic,
+    Hashable,
+    Iterable,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import urlparse
 import base64
 import json
-import operator
+from sys import intern
 
 from harf_serde import (
+    ParamF,
+    PostDataParamF,
     PostDataTextF,
     QueryStringF,
     HeaderF,
@@ -33,7 +49,54 @@ from harf.correlations.paths import (
     ResponsePath,
     EntryPath,
 )
-from harf.jsonf import jsonf_cata, JsonF, JsonPrims
+from harf.correlations.bodies import (
+    BodyFilter,
+    BodyMemo,
+    BodyStore,
+    body_key,
+    decoder_for,
+    loads,
+    maybe_rounded,
+    no_filter,
+)
+from harf.jsonf import Json, JsonPrims
+
+
+class TypedValue:
+    """A json number or boolean that is only equal to values of the same type.
+
+    Python treats `1`, `1.0` and `True` as the same dict key, which would put unrelated values in
+    one bucket. `TypedValue`s hash and repr like the wrapped value, so an `Env` can still be
+    indexed with and displays plain values.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: JsonPrims):
+        self.value = value
+
+    def __eq__(self, other):
+        if isinstance(other, TypedValue):
+            other = other.value
+        return type(other) is type(self.value) and other == self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+def value_key(value: JsonPrims, loose_types: bool = False) -> Hashable:
+    """The key of `value` in an `Env`, with `loose_types` `1`, `1.0` and `True` share a key."""
+    if not loose_types and isinstance(value, (int, float)):
+        return TypedValue(value)
+    return value
+
+
+def plain_value(key: Hashable) -> JsonPrims:
+    """The json value of an `Env` key."""
+    return key.value if isinstance(key, TypedValue) else key
 
 
 class Env(Dict[JsonPrims, List[Path]]):
@@ -52,15 +115,15 @@ class Env(Dict[JsonPrims, List[Path]]):
         return Env(res)
 
     def __ior__(self, other):
-        return self | other
+        for p, ps in other.items():
+            self.setdefault(p, []).extend(ps)
+        return self
 
     def __add__(self, other):
-        res = defaultdict(list)
-        for value in self:
-            res[value] += self[value]
-            if value in other:
-                res[value] += other[value]
-        return Env(res)
+        res = Env()
+        for value, paths in self.items():
+            res[value] = paths + other.get(value, [])
+        return res
 
     def __sub__(self, other):
         res = defaultdict(list)
@@ -70,30 +133,178 @@ class Env(Dict[JsonPrims, List[Path]]):
         return Env(res)
 
 
-def _json_env(element: JsonF[Env]) -> Env:
-    if isinstance(element, dict):
-        iter_ = element.items()
-        mk_path = StrPath
-    elif isinstance(element, list):
-        iter_ = enumerate(element)
-        mk_path = IntPath
+def path_values(env: Env) -> Dict[str, JsonPrims]:
+    """Maps the reference string of every path in `env` back to its value."""
+    return {str(p): plain_value(value) for value, paths in env.items() for p in paths}
+
+
+def json_env(
+    element: Json, loose_types: bool = False, keep: Optional[Container] = None
+) -> Env:
+    """Builds the env of every primitive in `element`.
+
+    Elements are visited with an explicit work stack carrying their path prefix as a linked list of
+    `(mk_path, key, parent)`, so siblings share their parent's prefix and each path is only built
+    once at its leaf. Keys are interned since the same keys repeat across every body of an api.
+    With `keep` only the paths of values in `keep` and of floats, which might be integers
+    `loads` rounded, are built.
+    """
+    env = Env()
+    end = EndPath()
+    stack = [(element, None)]
+    while stack:
+        element, prefix = stack.pop()
+        if isinstance(element, dict):
+            stack.extend(
+                (v, (StrPath, intern(k), prefix)) for k, v in reversed(element.items())
+            )
+        elif isinstance(element, list):
+            stack.extend(
+                (element[i], (IntPath, i, prefix))
+                for i in reversed(range(len(element)))
+            )
+        else:
+            value = value_key(element, loose_types)
+            if keep is not None and value not in keep and type(element) is not float:
+                continue
+            path = end
+            while prefix is not None:
+                mk_path, key, prefix = prefix
+                path = mk_path(key, path)
+            env.setdefault(value, []).append(path)
+    return env
+
+
+def _body_env(
+    text,
+    mime_type: str,
+    encoding: Optional[str],
+    loose_types: bool,
+    bodies: BodyFilter,
+    store_body: Optional[Callable[[Json], None]] = None,
+    keep: Optional[Container] = None,
+) -> Tuple[Env, Optional[str]]:
+    """The env of a body with a decoder, and the reason it was skipped by `bodies`.
+
+    Bodies their decoder fails on are skipped with the reason `"decode"`. The decoded body is
+    passed to `store_body`. With `keep` only values in `keep` are in the env.
+    """
+    if encoding == "base64":
+        try:
+            text = base64.b64decode(text)
+        except ValueError:
+            return Env(), "decode"
+    reason = bodies.skip_reason(mime_type, text)
+    if reason is not None:
+        return Env(), reason
+    decoder = decoder_for(mime_type)
+    try:
+        body = decoder(text, mime_type, loads)
+    except Exception:
+        # Decoders can be registered by anyone, they raise whatever their parser raises.
+        return Env(), "decode"
+    env = json_env(body, loose_types, keep)
+    if any(maybe_rounded(plain_value(v)) for v in env):
+        body = decoder(text, mime_type, json.loads)
+        env = json_env(body, loose_types, keep)
+    if store_body is not None:
+        store_body(body)
+    if keep is not None:
+        env = Env((value, paths) for value, paths in env.items() if value in keep)
+    return env.map_paths(BodyPath), None
+
+
+def _stored_body(text, mime_type: str, encoding: Optional[str]) -> Json:
+    """A body decoded by its decoder with `json.loads`, which never rounds numbers."""
+    if encoding == "base64":
+        text = base64.b64decode(text)
+    return decoder_for(mime_type)(text, mime_type, json.loads)
+
+
+def body_env(
+    text,
+    mime_type: str,
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    encoding: Optional[str] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+    keep: Optional[Container] = None,
+    request: bool = False,
+) -> Env:
+    """The env of a body decoded by the decoder of its mime type, a request body with `request`.
+
+    Bodies that are empty, have no decoder, fail to decode or are skipped by `bodies` have an
+    empty env, skipped bodies are counted by reason in `skipped`. With a `memo` a body seen before
+    is not decoded again, its env is copied from the memo. Bodies the `store` keeps are added to
+    it, a body the memo has but the store does not is only decoded to be stored.
+    With `keep` only the values in `keep` are in the env, the paths of the others are not built.
+    """
+    if not text or decoder_for(mime_type) is None:
+        return Env()
+    store_body = None
+    if memo is not None or store is not None:
+        key = body_key(text, mime_type, encoding)
+        if store is not None and store.keep(mime_type, request):
+            if key in store:
+                # Only counts another copy of the stored body.
+                store.add(key, None)
+            else:
+                store_body = partial(store.add, key)
+    make = partial(
+        _body_env, text, mime_type, encoding, loose_types, bodies, store_body, keep
+    )
+    if memo is None:
+        env, reason = make()
     else:
-        return Env({element: [EndPath()]})
-    res = Env()
-    for path, env in iter_:
-        res |= env.map_paths(lambda p: mk_path(path, p))
-    return res
+        memo.use_keep(keep)
+        env, reason = memo.get(key + (loose_types, bodies), make)
+        env = Env((value, paths.copy()) for value, paths in env.items())
+        if reason is None and store_body is not None and key not in store:
+            # The memo only keeps envs, a body first seen where it is not stored, e.g. as a
+            # request body that is not rendered, is decoded once more to be stored.
+            store_body(_stored_body(text, mime_type, encoding))
+    if reason is not None and skipped is not None:
+        skipped[reason] += 1
+    return env
 
 
-json_env = partial(jsonf_cata, _json_env)
+def param_env(p: ParamF) -> Env:
+    if not isinstance(p.value, str):
+        return Env()
+    return Env({p.value: [StrPath(p.name, EndPath())]})
 
 
-def post_data_env(pd: PostDataTextF) -> Env:
-    if "application/json" in pd.mimeType:
-        text = pd.text
-        if text != "":
-            return json_env(json.loads(text)).map_paths(BodyPath)
-    return Env()
+def post_data_env(
+    pd: Union[PostDataTextF, PostDataParamF[Env]],
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+    keep: Optional[Container] = None,
+) -> Env:
+    """The env of a text body, or of the envs of its params built by `param_env`."""
+    if isinstance(pd, PostDataParamF):
+        reason = bodies.skip_reason(pd.mimeType, "")
+        if reason is not None:
+            if skipped is not None:
+                skipped[reason] += 1
+            return Env()
+        return merged_env(BodyPath, pd.params)
+    return body_env(
+        pd.text,
+        pd.mimeType,
+        loose_types,
+        bodies,
+        skipped,
+        None,
+        memo,
+        store,
+        keep,
+        request=True,
+    )
 
 
 def header_env(h: HeaderF) -> Env:
@@ -111,49 +322,76 @@ def query_string_env(q: QueryStringF) -> Env:
     return Env({q.value: [QueryPath(q.name, EndPath())]})
 
 
-def request_env(r: RequestF[Env, Env, Env, Env]) -> Env:
+def merged_env(f: Callable[[Path], Path], envs: Iterable[Env]) -> Env:
+    """`reduce(operator.or_, envs).map_paths(f)` without building the intermediate envs."""
+    res = Env()
+    for env in envs:
+        for value, paths in env.items():
+            res.setdefault(value, []).extend(map(f, paths))
+    return res
+
+
+def request_env(r: RequestF[Env, Env, Env, Env], loose_types: bool = False) -> Env:
     url_path = urlparse(r.url).path.strip("/").split("/")
     request_env = r.postData or Env()
     for i, p in enumerate(url_path):
         path = [UrlPath(i, EndPath())]
         if p.isdigit():
             p = int(p)
+        p = value_key(p, loose_types)
         if p in request_env:
             request_env[p] = path + request_env[p]
         else:
             request_env[p] = path
-    return reduce(
-        operator.or_,
-        r.cookies,
-        reduce(
-            operator.or_, r.headers, reduce(operator.or_, r.queryString, request_env)
-        ),
-    ).map_paths(RequestPath)
-
-
-def content_env(c: ContentF) -> Env:
-    if "application/json" in c.mimeType:
-        text = c.text
-        if c.encoding == "base64":
-            text = base64.b64decode(text)
-        if text != "":
-            return json_env(json.loads(text)).map_paths(BodyPath)
-    return Env()
+    return merged_env(
+        RequestPath, chain([request_env], r.queryString, r.headers, r.cookies)
+    )
+
+
+def content_env(
+    c: ContentF,
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+    keep: Optional[Container] = None,
+) -> Env:
+    return body_env(
+        c.text, c.mimeType, loose_types, bodies, skipped, c.encoding, memo, store, keep
+    )
 
 
 def response_env(r: ResponseF[Env, Env, Env]) -> Env:
-    return reduce(
-        operator.or_, r.cookies, reduce(operator.or_, r.headers, r.content)
-    ).map_paths(ResponsePath)
+    return merged_env(ResponsePath, chain([r.content], r.headers, r.cookies))
 
 
 def entry_env(e: EntryF[Env, Env, Env, Env]) -> Env:
     return e.request | e.response
 
 
+def entry_envs(e: EntryF[Env, Env, Env, Env]) -> Tuple[Env, Env]:
+    """The request and response valued envs of an entry, kept apart."""
+    return e.request, e.response
+
+
+def add_entry_env(env: Env, index: int, entry: Env) -> None:
+    """Adds the env of the `index`th entry to `env`."""
+    for prim, paths in entry.items():
+        env.setdefault(prim, []).extend(EntryPath(index, p) for p in paths)
+
+
 def log_env(l: LogF[Env, Env, Env, Env]) -> Env:
-    log_env = defaultdict(list)
+    log_env = Env()
     for i, entry in enumerate(l.entries):
-        for prim, paths in entry.items():
-            log_env[prim] += [EntryPath(i, p) for p in paths]
-    return Env(log_env)
+        add_entry_env(log_env, i, entry)
+    return log_env
+
+
+def log_envs(l: LogF[Env, Env, Env, Tuple[Env, Env]]) -> Tuple[Env, Env]:
+    request_values = Env()
+    response_values = Env()
+    for i, (request, response) in enumerate(l.entries):
+        add_entry_env(request_values, i, request)
+        add_entry_env(response_values, i, response)
+    return request_values, response_values
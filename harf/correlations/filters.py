@@ -0,0 +1,75 @@
+"""Filtering `Env`s by how often their values are referenced.
+
+Everything here only looks at the number of paths of every value, the reference counts, which
+`EnvView`s know without looking at their paths. Filtered envs share the path lists of the env
+they are filtered from.
+"""
+
+import heapq
+from collections import Counter
+from typing import Callable, Dict, List, Mapping, Sequence
+
+from harf.correlations.envs import Env, Path
+
+
+def reference_counts(env: Mapping[object, Sequence[Path]]) -> List[int]:
+    """The number of paths of every value of `env`, in the order of `env`."""
+    counts = getattr(env, "counts", None)
+    if counts is not None:
+        return counts()
+    return list(map(len, env.values()))
+
+
+def count_histogram(counts: Sequence[int]) -> Dict[int, int]:
+    """How many values have each reference count, by increasing count."""
+    return dict(sorted(Counter(counts).items()))
+
+
+def count_percentile(histogram: Dict[int, int], percent: float) -> int:
+    """The smallest reference count that at least `percent` of the values do not exceed."""
+    total = sum(histogram.values())
+    seen = 0
+    for count, values in histogram.items():
+        seen += values
+        if seen >= total * percent:
+            return count
+    return 0
+
+
+def filter_counts(
+    env: Mapping[object, Sequence[Path]], keep: Callable[[int], bool]
+) -> Env:
+    """The values of `env` whose reference count is kept by `keep`."""
+    return Env(
+        (value, paths)
+        for (value, paths), count in zip(env.items(), reference_counts(env))
+        if keep(count)
+    )
+
+
+def filter_bounds(
+    env: Mapping[object, Sequence[Path]], min_count: int, max_count: int
+) -> Env:
+    """The values of `env` referenced between `min_count` and `max_count` times, inclusive."""
+    return filter_counts(env, lambda count: min_count <= count <= max_count)
+
+
+def filter_by_percentages(
+    min_percent: float, max_percent: float, env: Mapping[object, Sequence[Path]]
+) -> Env:
+    """The values of `env` referenced between percentages of its largest reference count."""
+    max_reference_count = max(reference_counts(env), default=0)
+    min_bound = int(max_reference_count * min_percent)
+    max_bound = int(max_reference_count * max_percent)
+    return filter_bounds(env, min_bound, max_bound)
+
+
+def top_values(env: Mapping[object, Sequence[Path]], n: int) -> Env:
+    """The `n` most referenced values of `env`, most referenced first.
+
+    Values with the same reference count keep their order in `env`.
+    """
+    counts = reference_counts(env)
+    top = heapq.nlargest(n, range(len(counts)), key=counts.__getitem__)
+    values = list(env)
+    return Env((values[i], env[values[i]]) for i in top)
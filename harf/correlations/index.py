@@ -0,0 +1,177 @@
+"""`Env`s flattened into integer arrays.
+
+Every path is stored as `(tag, operand)` pairs of integers, from its outermost segment inwards.
+Operands are indexes, or ids into a table of the strings used as keys, and segments without one
+use `0`. The paths of a value are only turned back into `Path` objects once they are used.
+"""
+
+from array import array
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from harf.correlations.envs import Env
+from harf.correlations.paths import (
+    Path,
+    IntPath,
+    StrPath,
+    EndPath,
+    UrlPath,
+    QueryPath,
+    HeaderPath,
+    CookiePath,
+    OffsetPath,
+    BodyPath,
+    RequestPath,
+    ResponsePath,
+    EntryPath,
+)
+
+_classes = [
+    None,
+    EntryPath,
+    RequestPath,
+    ResponsePath,
+    BodyPath,
+    UrlPath,
+    QueryPath,
+    HeaderPath,
+    CookiePath,
+    IntPath,
+    StrPath,
+    OffsetPath,
+]
+_tags = {cls: tag for tag, cls in enumerate(_classes) if cls is not None}
+_int_tags = {_tags[EntryPath], _tags[UrlPath], _tags[IntPath], _tags[OffsetPath]}
+_str_tags = {_tags[QueryPath], _tags[HeaderPath], _tags[CookiePath], _tags[StrPath]}
+
+
+def encode_path(path: Path, codes: array, strings: Dict[str, int]) -> None:
+    """Appends the `(tag, operand)` pairs of `path` to `codes`, interning keys into `strings`."""
+    while not isinstance(path, EndPath):
+        tag = _tags[type(path)]
+        codes.append(tag)
+        if tag in _int_tags:
+            codes.append(path.index)
+        elif tag in _str_tags:
+            codes.append(strings.setdefault(path.key, len(strings)))
+        else:
+            codes.append(0)
+        path = path.next_
+
+
+def decode_path(codes: Sequence[int], start: int, end: int, strings: List[str]) -> Path:
+    path = EndPath()
+    for i in range(end - 2, start - 2, -2):
+        tag = codes[i]
+        cls = _classes[tag]
+        if tag in _int_tags:
+            path = cls(codes[i + 1], path)
+        elif tag in _str_tags:
+            path = cls(strings[codes[i + 1]], path)
+        else:
+            path = cls(path)
+    return path
+
+
+class EnvIndex:
+    """An `Env` as arrays.
+
+    The paths of the `i`th value are `path_offsets[value_offsets[i]:value_offsets[i + 1]]`, and
+    the codes of the `j`th path are `codes[path_offsets[j]:path_offsets[j + 1]]`.
+    The arrays can be any integer sequence, like a `memoryview` of a memory-mapped file.
+    """
+
+    def __init__(
+        self,
+        values: List,
+        value_offsets: Sequence[int],
+        path_offsets: Sequence[int],
+        codes: Sequence[int],
+        strings: List[str],
+    ):
+        self.values = values
+        self.value_offsets = value_offsets
+        self.path_offsets = path_offsets
+        self.codes = codes
+        self.strings = strings
+
+    @classmethod
+    def from_env(cls, env: Env) -> "EnvIndex":
+        value_offsets = array("q", [0])
+        path_offsets = array("q", [0])
+        codes = array("q")
+        strings: Dict[str, int] = {}
+        for paths in env.values():
+            for path in paths:
+                encode_path(path, codes, strings)
+                path_offsets.append(len(codes))
+            value_offsets.append(len(path_offsets) - 1)
+        return cls(list(env), value_offsets, path_offsets, codes, list(strings))
+
+    def count(self, i: int) -> int:
+        """The number of paths of the `i`th value."""
+        return self.value_offsets[i + 1] - self.value_offsets[i]
+
+    def path(self, j: int) -> Path:
+        """The decoded `j`th path."""
+        offsets = self.path_offsets
+        return decode_path(self.codes, offsets[j], offsets[j + 1], self.strings)
+
+    def paths(self, i: int) -> List[Path]:
+        """The decoded paths of the `i`th value."""
+        offsets = self.path_offsets
+        return [
+            decode_path(self.codes, offsets[j], offsets[j + 1], self.strings)
+            for j in range(self.value_offsets[i], self.value_offsets[i + 1])
+        ]
+
+    def to_env(self) -> Env:
+        """An `Env` of this index whose paths are decoded when first used."""
+        return Env(
+            (value, LazyPaths(((self, i),))) for i, value in enumerate(self.values)
+        )
+
+
+class LazyPaths(Sequence[Path]):
+    """The paths of values in `EnvIndex`s, decoded the first time they are used.
+
+    Their length and concatenation with other `LazyPaths` do not decode anything, so envs can be
+    joined and filtered by reference counts without materializing their paths.
+    """
+
+    __slots__ = ("ranges", "_paths")
+
+    def __init__(self, ranges: Tuple[Tuple[EnvIndex, int], ...]):
+        self.ranges = ranges
+        self._paths = None
+
+    def _decoded(self) -> List[Path]:
+        if self._paths is None:
+            self._paths = [p for index, i in self.ranges for p in index.paths(i)]
+        return self._paths
+
+    def __len__(self):
+        return sum(index.count(i) for index, i in self.ranges)
+
+    def __getitem__(self, i):
+        return self._decoded()[i]
+
+    def __iter__(self) -> Iterator[Path]:
+        return iter(self._decoded())
+
+    def __add__(self, other):
+        if isinstance(other, LazyPaths):
+            return LazyPaths(self.ranges + other.ranges)
+        if not other:
+            return self
+        return self._decoded() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self._decoded()
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyPaths, list)):
+            return self._decoded() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self._decoded())
@@ -1,11 +1,14 @@
 import base64
 import colorsys
+import hashlib
 import textwrap
 import json
 import pathlib
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from functools import partial
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 from itertools import chain
 from urllib.parse import urlparse
 
@@ -24,8 +27,9 @@ from harf_serde import (
     harf,
 )
 
+from harf.correlations.bodies import BodyStore, body_key
 from harf.correlations.envs import Env
-from harf.jsonf import jsonf_cata, JsonF, JsonPrims
+from harf.jsonf import Json, JsonPrims
 
 app_json = {
     "livePreview": True,
@@ -85,6 +89,7 @@ class VariableName:
 
 
 ObsidianData = Dict[Union[FileName, VariableName], str]
+Links = Dict[JsonPrims, str]
 
 
 class ReservedVariables:
@@ -98,50 +103,120 @@ class ReservedVariables:
     comment = VariableName("comment")
 
 
-def _get_link(env: Env, value: JsonPrims) -> str:
-    if value in env:
-        link = str(env[value][0]).replace("[", "_").replace("]", "")
-        link = f"[[{link}|{value}]]"
-        if "'" in repr(value):
-            return f'"{link}"'
-        return link
-    return repr(value)
-
-
-def _json_str(env: Env, element: JsonF[str]) -> str:
-    if isinstance(element, dict):
-        res = "- \\{\n"
-        for k, v in element.items():
-            key = repr(k).replace("'", '"')
-            res += textwrap.indent(f"- {key}: {v.lstrip('- ')}", " " * 4) + "\n"
-        return res + "- \\}"
-    elif isinstance(element, list):
-        res = "- \\[\n"
-        for e in element:
-            res += textwrap.indent("- " + e.lstrip("- "), " " * 4) + "\n"
-        return res + "- \\]"
-    else:
-        return _get_link(env, element)
+def mk_links(env: Env) -> Links:
+    """The link target of every value in `env`, the first place it is used.
+
+    Rendering a note looks values up here instead of rendering the target of every use again. The
+    label is the value that is looked up, with `--loose-types` it can differ from the key in `env`.
+    """
+    return {
+        key: str(paths[0]).replace("[", "_").replace("]", "")
+        for key, paths in env.items()
+    }
+
+
+def _get_link(links: Links, value: JsonPrims) -> str:
+    target = links.get(value)
+    if target is None:
+        return repr(value)
+    link = f"[[{target}|{value}]]"
+    if "'" in repr(value):
+        return f'"{link}"'
+    return link
+
+
+_line_breaks = re.compile("[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+def _indent(text: str, level: int) -> str:
+    prefix = "    " * level
+    if _line_breaks.search(text):
+        return textwrap.indent(text, prefix)
+    return prefix + text
+
+
+def json_(links: Links, element: Json) -> str:
+    """Renders `element` as a nested markdown list linking the values in `links`.
+
+    Lines are appended to one buffer with their indentation tracked as a depth, instead of
+    re-indenting the rendered children in every ancestor.
+    """
+    out = []
+    stack = [(element, 0, None)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            out.append(item)
+            continue
+        element, level, head = item
+        if isinstance(element, dict):
+            open_, close = "\\{", "\\}"
+            children = [
+                (v, level + 1, "- " + repr(k).replace("'", '"') + ": ")
+                for k, v in element.items()
+            ]
+        elif isinstance(element, list):
+            open_, close = "\\[", "\\]"
+            children = [(e, level + 1, "- ") for e in element]
+        elif head is None:
+            out.append(_get_link(links, element))
+            continue
+        else:
+            link = _get_link(links, element).lstrip("- ")
+            out.append(_indent(head + link, level) + "\n")
+            continue
+        prefix = "    " * level
+        out.append(f"{prefix}{head or '- '}{open_}\n")
+        stack.append(f"{prefix}- {close}" + ("\n" if head else ""))
+        stack.extend(reversed(children))
+    return "".join(out)
+
+
+def renders_body(mime_type: str, request: bool = False) -> bool:
+    """If bodies of `mime_type` are rendered, the ones that are worth keeping in a `BodyStore`.
+
+    Request bodies are only rendered with exactly the json mime type, without parameters.
+    """
+    if request:
+        return mime_type == "application/json"
+    return "application/json" in mime_type
+
+
+def _body(store: Optional[BodyStore], text, mime_type: str, encoding=None) -> Json:
+    """The decoded json body, taken from `store` if it was decoded while building the env.
+
+    Raises `ValueError` if the body is not json, its env was skipped with the reason `"decode"`.
+    """
 
+    def decode() -> Json:
+        data = base64.b64decode(text) if encoding == "base64" else text
+        return json.loads(data)
 
-def json_(env: Env, element: JsonF) -> str:
-    return jsonf_cata(partial(_json_str, env), element)
+    if store is None:
+        return decode()
+    return store.take(body_key(text, mime_type, encoding), decode)
 
 
-def post_data(env: Env, pd: PostDataTextF) -> ObsidianData:
-    if pd.mimeType == "application/json":
+def post_data(
+    links: Links, store: Optional[BodyStore], pd: PostDataTextF
+) -> ObsidianData:
+    if renders_body(pd.mimeType, request=True):
         text = pd.text
         if text != "":
-            return {ReservedVariables.post_data: json_(env, json.loads(pd.text))}
+            try:
+                body = _body(store, text, pd.mimeType)
+            except ValueError:
+                return {}
+            return {ReservedVariables.post_data: json_(links, body)}
     return {}
 
 
-def query_string(env: Env, qs: QueryStringF) -> ObsidianData:
-    return {ReservedVariables.query_string: f"{qs.name}: {_get_link(env, qs.value)}"}
+def query_string(links: Links, qs: QueryStringF) -> ObsidianData:
+    return {ReservedVariables.query_string: f"{qs.name}: {_get_link(links, qs.value)}"}
 
 
 def request(
-    env: Env, r: RequestF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
+    links: Links, r: RequestF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
 ) -> ObsidianData:
     obsidian_data = {}
 
@@ -150,7 +225,7 @@ def request(
     for p in url:
         if p.isdigit():
             p = int(p)
-        f_url += _get_link(env, p).strip("'\"") + "/"
+        f_url += _get_link(links, p).strip("'\"") + "/"
 
     query_string = ""
     post_data = r.postData if r.postData is not None else {}
@@ -167,24 +242,24 @@ def request(
     return obsidian_data
 
 
-def content(env: Env, c: ContentF) -> ObsidianData:
-    if "application/json" in c.mimeType:
-        text = c.text
-        if c.encoding == "base64":
-            text = base64.b64decode(text)
-        if text != "":
-            return {ReservedVariables.content: json_(env, json.loads(text))}
+def content(links: Links, store: Optional[BodyStore], c: ContentF) -> ObsidianData:
+    if renders_body(c.mimeType) and c.text:
+        try:
+            body = _body(store, c.text, c.mimeType, c.encoding)
+        except ValueError:
+            return {}
+        return {ReservedVariables.content: json_(links, body)}
     return {}
 
 
 def response(
-    env: Env, r: ResponseF[ObsidianData, ObsidianData, ObsidianData]
+    links: Links, r: ResponseF[ObsidianData, ObsidianData, ObsidianData]
 ) -> ObsidianData:
     return r.content
 
 
 def entry(
-    env: Env, e: EntryF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
+    links: Links, e: EntryF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
 ) -> ObsidianData:
     obsidian_data = {}
 
@@ -228,12 +303,12 @@ def entry(
     return obsidian_data
 
 
-def page(env: Env, p: PageF[ObsidianData]) -> ObsidianData:
+def page(links: Links, p: PageF[ObsidianData]) -> ObsidianData:
     return {ReservedVariables.page_id: p.id}
 
 
 def log(
-    env: Env, e: LogF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
+    links: Links, e: LogF[ObsidianData, ObsidianData, ObsidianData, ObsidianData]
 ) -> ObsidianData:
     obsidian_data = {}
     request_responses = {}
@@ -289,24 +364,74 @@ def log(
     return {**obsidian_data, **request_responses, **vault_settings}
 
 
-def mk_obsidian(env: Env, h: Har) -> ObsidianData:
+def mk_obsidian(env: Env, h: Har, store: Optional[BodyStore] = None) -> ObsidianData:
+    """The notes of `h`, bodies decoded while building `env` are taken from `store`."""
+    links = mk_links(env)
     return harf(
-        post_data=partial(post_data, env),
-        querystring=partial(query_string, env),
-        request=partial(request, env),
-        content=partial(content, env),
-        response=partial(response, env),
-        entry=partial(entry, env),
-        page=partial(page, env),
-        log=partial(log, env),
+        post_data=partial(post_data, links, store),
+        querystring=partial(query_string, links),
+        request=partial(request, links),
+        content=partial(content, links, store),
+        response=partial(response, links),
+        entry=partial(entry, links),
+        page=partial(page, links),
+        log=partial(log, links),
         default={},
     )(h)
 
 
-def write_files(od: ObsidianData, root: pathlib.Path) -> None:
+@dataclass
+class WriteStats:
+    written: int = 0
+    skipped: int = 0
+    bytes_written: int = 0
+
+
+manifest_name = ".obsidian/harf_manifest.json"
+
+
+def _write(file: pathlib.Path, data: bytes) -> int:
+    with open(file, "wb") as f:
+        return f.write(data)
+
+
+def write_files(od: ObsidianData, root: pathlib.Path, threads: int = 8) -> WriteStats:
+    """Writes the files of `od` under `root`.
+
+    The content hash of every file is kept in a manifest in the vault, files that are unchanged
+    since the last export are skipped and the rest are written by a pool of `threads` threads.
+    """
+    manifest_path = root / manifest_name
+    try:
+        with open(manifest_path) as file:
+            previous = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = {}
+
+    stats = WriteStats()
+    manifest = {}
+    files = []
     for type_, value in od.items():
-        if isinstance(type_, FileName):
-            with open(root / pathlib.Path(type_.name), "w") as file:
-                file.write(value)
-        else:
+        if not isinstance(type_, FileName):
             print("Unused thing", type_, value)
+            continue
+        data = value.encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        manifest[type_.name] = digest
+        file = root / pathlib.Path(type_.name)
+        if previous.get(type_.name) == digest and file.exists():
+            stats.skipped += 1
+        else:
+            files.append((file, data))
+
+    for directory in {file.parent for file, _ in files} | {manifest_path.parent}:
+        directory.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(threads) as pool:
+        sizes = pool.map(_write, [file for file, _ in files], [d for _, d in files])
+        for size in sizes:
+            stats.written += 1
+            stats.bytes_written += size
+
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file)
+    return stats
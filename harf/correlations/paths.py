@@ -12,32 +12,82 @@ class Path(Protocol):
         ...
 
 
-@dataclass
-class IntPath(Generic[A]):
-    index: int
-    next_: A
+class _Link:
+    """A path segment linked to the rest of the path through `next_`.
+
+    Paths are as deep as the json they come from, so `len`, `str` and `==` walk the
+    links in a loop instead of recursing. Every subclass renders its own segment with
+    `_segment`.
+    """
+
+    __slots__ = ()
+
+    def _key(self) -> tuple:
+        return ()
 
     def __str__(self):
-        return f"[{self.index}]{self.next_}"
+        segments = []
+        path = self
+        while isinstance(path, _Link):
+            segments.append(path._segment())
+            path = path.next_
+        segments.append(str(path))
+        return "".join(segments)
 
     def __len__(self):
-        return 1 + len(self.next_)
+        length = 0
+        path = self
+        while isinstance(path, _Link):
+            length += 1
+            path = path.next_
+        return length + len(path)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        path = self
+        while isinstance(path, _Link):
+            if path.__class__ is not other.__class__ or path._key() != other._key():
+                return False
+            path, other = path.next_, other.next_
+        return path == other
+
+
+@dataclass(eq=False)
+class IntPath(_Link, Generic[A]):
+    __slots__ = ("index", "next_")
+    index: int
+    next_: A
 
+    def _segment(self):
+        return f"[{self.index}]"
 
-@dataclass
-class StrPath(Generic[A]):
+    def _key(self):
+        return (self.index,)
+
+
+@dataclass(eq=False)
+class StrPath(_Link, Generic[A]):
+    __slots__ = ("key", "next_")
     key: str
     next_: A
 
-    def __str__(self):
-        return f".{self.key}{self.next_}"
+    def _segment(self):
+        return f".{self.key}"
 
-    def __len__(self):
-        return 1 + len(self.next_)
+    def _key(self):
+        return (self.key,)
 
 
 @dataclass
 class EndPath:
+    """The end of every path, `EndPath()` always returns the same shared instance."""
+
+    __slots__ = ()
+
+    def __new__(cls):
+        return _end_path
+
     def __str__(self):
         return ""
 
@@ -45,69 +95,84 @@ class EndPath:
         return 1
 
 
+_end_path = object.__new__(EndPath)
+
+
 DataPath = Union[IntPath[A], StrPath[A], EndPath]["DataPath"]  # type: ignore[index]
 
 
 class UrlPath(IntPath[DataPath]):
-    def __str__(self):
-        return f".url{super().__str__()}"
+    __slots__ = ()
+
+    def _segment(self):
+        return f".url{super()._segment()}"
 
 
 class QueryPath(StrPath[DataPath]):
-    def __str__(self):
-        return f".queryString{super().__str__()}"
+    __slots__ = ()
+
+    def _segment(self):
+        return f".queryString{super()._segment()}"
 
 
 class HeaderPath(StrPath[DataPath]):
-    def __str__(self):
-        return f".header{super().__str__()}"
+    __slots__ = ()
+
+    def _segment(self):
+        return f".header{super()._segment()}"
 
 
 class CookiePath(StrPath[DataPath]):
-    def __str__(self):
-        return f".cookie{super().__str__()}"
+    __slots__ = ()
 
+    def _segment(self):
+        return f".cookie{super()._segment()}"
 
-@dataclass
-class BodyPath:
-    next_: DataPath
 
-    def __str__(self):
-        return f".body{self.next_}"
+class OffsetPath(IntPath[EndPath]):
+    """Where in a string a value was found, e.g. `.header.Authorization@7`."""
 
-    def __len__(self):
-        return 1 + len(self.next_)
+    __slots__ = ()
 
+    def _segment(self):
+        return f"@{self.index}"
 
-@dataclass
-class RequestPath:
-    next_: Union[UrlPath, QueryPath, BodyPath, HeaderPath]
 
-    def __str__(self):
-        return f".request{self.next_}"
+@dataclass(eq=False)
+class BodyPath(_Link):
+    __slots__ = ("next_",)
+    next_: DataPath
 
-    def __len__(self):
-        return 1 + len(self.next_)
+    def _segment(self):
+        return ".body"
 
 
-@dataclass
-class ResponsePath:
-    next_: Union[HeaderPath, BodyPath]
+@dataclass(eq=False)
+class RequestPath(_Link):
+    __slots__ = ("next_",)
+    next_: Union[UrlPath, QueryPath, BodyPath, HeaderPath]
 
-    def __str__(self):
-        return f".response{self.next_}"
+    def _segment(self):
+        return ".request"
 
-    def __len__(self):
-        return 1 + len(self.next_)
 
+@dataclass(eq=False)
+class ResponsePath(_Link):
+    __slots__ = ("next_",)
+    next_: Union[HeaderPath, BodyPath]
 
-@dataclass
-class EntryPath:
+    def _segment(self):
+        return ".response"
+
+
+@dataclass(eq=False)
+class EntryPath(_Link):
+    __slots__ = ("index", "next_")
     index: int
     next_: Union[RequestPath, ResponsePath]
 
-    def __str__(self):
-        return f"entry_{self.index}{self.next_}"
+    def _segment(self):
+        return f"entry_{self.index}"
 
-    def __len__(self):
-        return 1 + len(self.next_)
+    def _key(self):
+        return (self.index,)
@@ -0,0 +1,545 @@
+"""Building the envs of har files and correlating them.
+
+Entries are folded a chunk at a time, in a pool of processes with more than one job, and the
+chunk envs are merged into columnar envs in entry order.
+"""
+
+import collections
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import (
+    Callable,
+    Container,
+    Counter,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import click
+from serde.json import from_json
+from harf_serde import Entry, FHar, Har, harf
+
+from harf.correlations.envs import (
+    param_env,
+    post_data_env,
+    header_env,
+    cookie_env,
+    query_string_env,
+    content_env,
+    response_env,
+    request_env,
+    entry_env,
+    entry_envs,
+    log_env,
+    log_envs,
+    add_entry_env,
+    Env,
+)
+from harf.correlations.bodies import BodyFilter, BodyMemo, BodyStore, no_filter
+from harf.correlations.columnar import EnvView, ValueTable
+from harf.correlations.diff import (
+    Difference,
+    EntryValues,
+    align,
+    differences,
+    entry_values,
+    fingerprint,
+    request_template,
+)
+from harf.correlations.filters import filter_by_percentages
+from harf.correlations.index import EnvIndex
+from harf.correlations.runs import Correlation, RunIndex
+from harf.correlations.sketches import ReferenceSketch
+from harf.grouping.by_comment import comment_pages, icomment_requests
+from harf.streaming import iter_entries
+
+
+def request_env_fold(
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: Optional[BodyFilter] = no_filter,
+    skipped: Optional[Counter[str]] = None,
+) -> Callable[[FHar], Env]:
+    """Folds a har into its request valued env, with `bodies=None` request bodies are ignored."""
+    return harf(
+        post_data=bodies
+        and partial(
+            post_data_env, loose_types=loose_types, bodies=bodies, skipped=skipped
+        ),
+        param=bodies and param_env,
+        header=header_env if headers else None,
+        cookie=cookie_env if cookies else None,
+        querystring=query_string_env,
+        request=partial(request_env, loose_types=loose_types),
+        entry=entry_env,
+        log=log_env,
+        default=Env(),
+    )
+
+
+def response_env_fold(
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: Optional[BodyFilter] = no_filter,
+    skipped: Optional[Counter[str]] = None,
+) -> Callable[[FHar], Env]:
+    """Folds a har into its response valued env, with `bodies=None` response bodies are ignored."""
+    return harf(
+        header=header_env if headers else None,
+        cookie=cookie_env if cookies else None,
+        content=bodies
+        and partial(
+            content_env, loose_types=loose_types, bodies=bodies, skipped=skipped
+        ),
+        response=response_env,
+        entry=entry_env,
+        log=log_env,
+        default=Env(),
+    )
+
+
+def entry_envs_fold(
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: Optional[BodyFilter] = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+    requests: bool = True,
+    responses: bool = True,
+    keep: Optional[Container] = None,
+) -> Callable[[FHar], Tuple[Env, Env]]:
+    """Folds a har or entry into its request and response valued envs in a single traversal.
+
+    Headers and cookies are folded once for both sides, `request_env` and `response_env` tell
+    them apart. With `bodies=None` bodies are ignored, with a `memo` repeated bodies are only
+    decoded once and decoded bodies are added to the `store`. The side that is not folded, by
+    `requests` or `responses`, has an empty env. With `keep` only the paths of body values in
+    `keep` are built.
+    """
+    body_options = dict(
+        loose_types=loose_types,
+        bodies=bodies,
+        skipped=skipped,
+        memo=memo,
+        store=store,
+    )
+    request_bodies = requests and bodies
+    response_bodies = responses and bodies
+    return harf(
+        post_data=request_bodies and partial(post_data_env, keep=keep, **body_options),
+        param=request_bodies and param_env,
+        header=header_env if headers else None,
+        cookie=cookie_env if cookies else None,
+        querystring=requests and query_string_env or None,
+        content=response_bodies and partial(content_env, keep=keep, **body_options),
+        request=requests and partial(request_env, loose_types=loose_types) or None,
+        response=responses and response_env or None,
+        entry=entry_envs,
+        log=log_envs,
+        default=Env(),
+    )
+
+
+def valued_envs(
+    har: Har,
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+) -> Tuple[Env, Env]:
+    """The same envs as `request_valued_env` and `response_valued_env`, in one traversal."""
+    fold = entry_envs_fold(headers, cookies, loose_types, bodies, skipped, memo, store)
+    return fold(har)
+
+
+def request_valued_env(
+    har: Har,
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+) -> Env:
+    return request_env_fold(headers, cookies, loose_types, bodies, skipped)(har)
+
+
+def response_valued_env(
+    har: Har,
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+) -> Env:
+    return response_env_fold(headers, cookies, loose_types, bodies, skipped)(har)
+
+
+# The body memo and values to keep of a worker process, kept between the chunks it builds.
+_worker_memo: Optional[BodyMemo] = None
+_worker_keep: Optional[Container] = None
+
+
+def _start_worker(memo_size: int, keep: Optional[Container] = None) -> None:
+    global _worker_memo, _worker_keep
+    _worker_memo = BodyMemo(memo_size)
+    _worker_keep = keep
+
+
+def _chunk_envs(
+    headers: bool,
+    cookies: bool,
+    loose_types: bool,
+    bodies: BodyFilter,
+    memo: Optional[BodyMemo],
+    store: Optional[BodyStore],
+    start: int,
+    entries: List[Entry],
+    requests: bool = True,
+    responses: bool = True,
+    keep: Optional[Container] = None,
+) -> Tuple[Env, Env, Counter[str], Tuple[int, int]]:
+    """The request and response valued envs of `entries`, which start at entry number `start`,
+    the number of bodies skipped by `bodies` and the hits and misses of the body memo.
+
+    Without a `memo` or `keep` the ones of the worker process are used. Decoded bodies are added
+    to `store`. With `keep` only values in `keep` are in the envs.
+    """
+    if memo is None:
+        memo = _worker_memo or BodyMemo(0)
+    if keep is None:
+        keep = _worker_keep
+    hits, misses = memo.hits, memo.misses
+    skipped: Counter[str] = collections.Counter()
+    sides = dict(requests=requests, responses=responses, keep=keep)
+    fold = entry_envs_fold(
+        headers, cookies, loose_types, bodies, skipped, memo, store, **sides
+    )
+    bodiless_fold = entry_envs_fold(headers, cookies, loose_types, None, **sides)
+    request_values = Env()
+    response_values = Env()
+    for i, entry in enumerate(entries, start):
+        if bodies.skip_url(entry.request.url):
+            request, response = bodiless_fold(entry)
+            if requests:
+                skipped["url"] += 1
+        else:
+            request, response = fold(entry)
+        if keep is not None:
+            request = Env((v, ps) for v, ps in request.items() if v in keep)
+            response = Env((v, ps) for v, ps in response.items() if v in keep)
+        add_entry_env(request_values, i, request)
+        add_entry_env(response_values, i, response)
+    memo_counts = (memo.hits - hits, memo.misses - misses)
+    return request_values, response_values, skipped, memo_counts
+
+
+def _encoded_chunk_envs(
+    *args,
+) -> Tuple[EnvIndex, EnvIndex, Counter[str], Tuple[int, int]]:
+    """`_chunk_envs` with its envs as `EnvIndex`s, to send them back from a worker process.
+
+    Paths are linked lists that are pickled recursively, the paths of deeply nested bodies would
+    exceed the recursion limit. Their flat integer arrays are pickled instead.
+    """
+    request_values, response_values, skipped, memo_counts = _chunk_envs(*args)
+    return (
+        EnvIndex.from_env(request_values),
+        EnvIndex.from_env(response_values),
+        skipped,
+        memo_counts,
+    )
+
+
+def _decoded_chunk_envs(
+    encoded: Tuple[EnvIndex, EnvIndex, Counter[str], Tuple[int, int]],
+) -> Tuple[Env, Env, Counter[str], Tuple[int, int]]:
+    request_index, response_index, skipped, memo_counts = encoded
+    return request_index.to_env(), response_index.to_env(), skipped, memo_counts
+
+
+def _chunks(entries: Iterable[Entry], size: int) -> Iterator[Tuple[int, List[Entry]]]:
+    entries = iter(entries)
+    start = 0
+    while chunk := list(islice(entries, size)):
+        yield start, chunk
+        start += len(chunk)
+
+
+def _ordered_chunk_envs(
+    chunks: Iterable[Tuple[int, List[Entry]]],
+    headers: bool,
+    cookies: bool,
+    loose_types: bool,
+    bodies: BodyFilter,
+    jobs: int,
+    memo: BodyMemo,
+    store: Optional[BodyStore] = None,
+    requests: bool = True,
+    responses: bool = True,
+    keep: Optional[Container] = None,
+) -> Iterator[Tuple[Env, Env, Counter[str], Tuple[int, int]]]:
+    """Yields the envs of every chunk in order, built in a pool of `jobs` processes.
+
+    At most two chunks per job are in flight so streamed entries are not all read at once.
+    Every process keeps a body memo of the size of `memo` and is sent `keep` once. Bodies are
+    only added to `store` by a single job, decoded bodies are not sent back from other processes.
+    Envs built by other processes have their paths decoded once they are used.
+    """
+    if jobs == 1:
+        for start, chunk in chunks:
+            yield _chunk_envs(
+                headers,
+                cookies,
+                loose_types,
+                bodies,
+                memo,
+                store,
+                start,
+                chunk,
+                requests,
+                responses,
+                keep,
+            )
+        return
+    with ProcessPoolExecutor(
+        jobs, initializer=_start_worker, initargs=(memo.maxsize, keep)
+    ) as pool:
+        pending = deque()
+        for start, chunk in chunks:
+            pending.append(
+                pool.submit(
+                    _encoded_chunk_envs,
+                    headers,
+                    cookies,
+                    loose_types,
+                    bodies,
+                    None,
+                    None,
+                    start,
+                    chunk,
+                    requests,
+                    responses,
+                )
+            )
+            if len(pending) >= 2 * jobs:
+                yield _decoded_chunk_envs(pending.popleft().result())
+        while pending:
+            yield _decoded_chunk_envs(pending.popleft().result())
+
+
+def entries_valued_envs(
+    entries: Iterable[Entry],
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    jobs: int = 1,
+    chunk_size: int = 64,
+    bodies: BodyFilter = no_filter,
+    skipped: Optional[Counter[str]] = None,
+    memo: Optional[BodyMemo] = None,
+    store: Optional[BodyStore] = None,
+    consumed_only: bool = False,
+    keep: Optional[Container] = None,
+) -> Tuple[EnvView, EnvView, List[str]]:
+    """Builds the request and response valued envs a chunk of entries at a time.
+
+    Only the envs and the url of every entry are kept, so `entries` can be streamed from the har file.
+    With more than one job chunks are built in parallel and merged back in entry order, so the
+    envs are identical to building them serially.
+    Bodies skipped by `bodies` are counted by reason in `skipped`.
+    Repeated bodies are only decoded once by `memo`, which counts the hits and misses of every job.
+    With a single job decoded bodies are added to `store`.
+    With `consumed_only` only the response values that are also request values are kept, which is
+    everything the correlations need. `entries` are then read twice, once for the request values
+    and once for the response values, where the paths of the other values are never built.
+    With `keep` only the values in `keep` are in the envs.
+    The envs are views of columnar envs of the same table, so they can be combined quickly.
+    """
+    urls = []
+
+    def chunks() -> Iterator[Tuple[int, List[Entry]]]:
+        for start, chunk in _chunks(entries, chunk_size):
+            urls.extend(e.request.url for e in chunk)
+            yield start, chunk
+
+    if memo is None:
+        memo = BodyMemo()
+    table = ValueTable()
+    request_columns = []
+    response_columns = []
+    options = (headers, cookies, loose_types, bodies, jobs, memo, store)
+
+    def add(chunk_envs: Iterator[Tuple[Env, Env, Counter[str], Tuple[int, int]]]):
+        for chunk_request, chunk_response, chunk_skipped, memo_counts in chunk_envs:
+            request_columns.append(table.columns(chunk_request))
+            response_columns.append(table.columns(chunk_response))
+            if skipped is not None:
+                skipped.update(chunk_skipped)
+            if jobs > 1:
+                memo.hits += memo_counts[0]
+                memo.misses += memo_counts[1]
+
+    if consumed_only:
+        add(_ordered_chunk_envs(chunks(), *options, responses=False, keep=keep))
+        requested = set(table.ids)
+        responses = _chunks(entries, chunk_size)
+        add(_ordered_chunk_envs(responses, *options, requests=False, keep=requested))
+    else:
+        add(_ordered_chunk_envs(chunks(), *options, keep=keep))
+    return (
+        table.env(request_columns).view(),
+        table.env(response_columns).view(),
+        urls,
+    )
+
+
+def sketch_entries(
+    entries: Iterable[Entry],
+    headers: bool = False,
+    cookies: bool = False,
+    loose_types: bool = False,
+    jobs: int = 1,
+    chunk_size: int = 64,
+    bodies: BodyFilter = no_filter,
+    memo: Optional[BodyMemo] = None,
+    sketch: Optional[ReferenceSketch] = None,
+) -> ReferenceSketch:
+    """Adds the references of `entries` to `sketch` a chunk at a time.
+
+    The envs of a chunk are dropped once they are added, so only the sketch is kept in memory.
+    """
+    if sketch is None:
+        sketch = ReferenceSketch()
+    if memo is None:
+        memo = BodyMemo()
+    for request_values, response_values, _, _ in _ordered_chunk_envs(
+        _chunks(entries, chunk_size), headers, cookies, loose_types, bodies, jobs, memo
+    ):
+        sketch.add(request_values, response_values)
+    return sketch
+
+
+class StreamedEntries:
+    """The re-paged entries of a har file, read from its start every time they are iterated."""
+
+    def __init__(self, har_file):
+        self.har_file = har_file
+
+    def __iter__(self) -> Iterator[Entry]:
+        self.har_file.seek(0)
+        return comment_pages(iter_entries(self.har_file), [])
+
+
+def _har_envs(
+    path: str,
+    headers: bool,
+    cookies: bool,
+    loose_types: bool,
+    bodies: BodyFilter = no_filter,
+    stream: bool = False,
+    memo_size: int = 1024,
+) -> Tuple[EnvView, EnvView, List[str], List[str]]:
+    """The request and response envs of the har at `path`, with the url and method of every entry."""
+    methods = []
+
+    def tracked(entries: Iterable[Entry]) -> Iterator[Entry]:
+        for entry in entries:
+            methods.append(entry.request.method)
+            yield entry
+
+    with click.open_file(path, encoding="utf-8-sig") as har_file:
+        if stream:
+            entries = comment_pages(iter_entries(har_file), [])
+        else:
+            har = from_json(Har, har_file.read())
+            icomment_requests(har.log)
+            entries = har.log.entries
+        request_values, response_values, urls = entries_valued_envs(
+            tracked(entries),
+            headers,
+            cookies,
+            loose_types,
+            bodies=bodies,
+            memo=BodyMemo(memo_size),
+        )
+    return request_values, response_values, urls, methods
+
+
+def har_correlations(
+    path: str,
+    headers: bool,
+    cookies: bool,
+    loose_types: bool,
+    bodies: BodyFilter = no_filter,
+    stream: bool = False,
+    memo_size: int = 1024,
+    min_percent: float = 0,
+    max_percent: float = 1,
+    verbose: bool = False,
+) -> List[Correlation]:
+    """The values of the har at `path` used more than once, by their first reference.
+
+    First references are always entry based so they are the same between runs, `verbose` only
+    changes the other references.
+    """
+    request_values, response_values, urls, _ = _har_envs(
+        path, headers, cookies, loose_types, bodies, stream, memo_size
+    )
+    env = request_values + response_values
+    if min_percent > 0 or max_percent < 1:
+        env = filter_by_percentages(min_percent, max_percent, env)
+    if verbose:
+        to_ref = lambda p: urls[p.index] + " " + str(p.next_).lstrip(".")
+    else:
+        to_ref = str
+    return [
+        (str(ps[0]), value, list(map(to_ref, ps[1:])))
+        for value, ps in env.items()
+        if len(ps) > 1
+    ]
+
+
+def runs_index(paths: List[str], jobs: int = 1, **options) -> RunIndex:
+    """The correlations of every har in `paths`, each found by its own process with `jobs`."""
+    index = RunIndex(paths)
+    correlate = partial(har_correlations, **options)
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            for run, correlations in enumerate(pool.map(correlate, paths)):
+                index.add(run, correlations)
+    else:
+        for run, path in enumerate(paths):
+            index.add(run, correlate(path))
+    return index
+
+
+def har_entry_values(path: str, **options) -> Tuple[List[str], EntryValues]:
+    """The `request_template` and values of every entry of the har at `path`."""
+    request_values, response_values, urls, methods = _har_envs(path, **options)
+    templates = list(map(request_template, methods, urls))
+    return templates, entry_values(request_values | response_values)
+
+
+def diff_hars(paths: List[str], jobs: int = 1, **options) -> Iterator[Difference]:
+    """The values that differ between aligned entries of the hars at `paths`."""
+    read = partial(har_entry_values, **options)
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            recordings = list(pool.map(read, paths))
+    else:
+        recordings = list(map(read, paths))
+    templates = [templates for templates, _ in recordings]
+    alignment = align([list(map(fingerprint, t)) for t in templates])
+    return differences(templates, alignment, [values for _, values in recordings])
@@ -0,0 +1,142 @@
+"""Rendering `Env`s one value at a time.
+
+Every renderer yields the output of one value at a time, so a report can be written as it is made
+instead of being built into a single string first. `text` is the human readable report, `jsonl`
+and `csv` are for piping into other tools. The `histogram_renderers` render a reference count
+histogram, see `count_histogram`, in the same formats.
+"""
+
+import csv
+import io
+from json import dumps
+from typing import Callable, Dict, Iterator, List, Mapping, TextIO, Tuple
+
+from harf.correlations.envs import plain_value
+from harf.correlations.paths import Path
+
+Renderer = Callable[[Mapping, bool, Callable[[Path], str]], Iterator[str]]
+
+
+def _references(
+    env: Mapping, diffable: bool, str_ref: Callable[[Path], str]
+) -> Iterator[Tuple[object, List[str]]]:
+    """The values of `env` with their references, diffable skips values used once."""
+    for value, paths in env.items():
+        if diffable and len(paths) == 1:
+            continue
+        yield value, list(map(str_ref, paths))
+
+
+def iter_text(
+    env: Mapping, diffable: bool = False, str_ref: Callable[[Path], str] = str
+) -> Iterator[str]:
+    for value, refs in _references(env, diffable, str_ref):
+        message = f"Value ({repr(value)}) used in:"
+        if diffable:
+            message = f"Value first seen at {refs[0]} used again in:"
+            refs = refs[1:]
+        lines = ",\n".join("    " + dumps(ref) for ref in refs)
+        yield f"{message}\n{lines}\n\n" if refs else f"{message}\n\n"
+
+
+def csv_value(value) -> str:
+    """An `Env` key as a csv field, non string values are json encoded."""
+    value = plain_value(value)
+    return value if isinstance(value, str) else dumps(value)
+
+
+def iter_jsonl(
+    env: Mapping, diffable: bool = False, str_ref: Callable[[Path], str] = str
+) -> Iterator[str]:
+    """One json object per value, values are left out when `diffable`."""
+    for value, refs in _references(env, diffable, str_ref):
+        if diffable:
+            record = {"first_seen": refs[0], "references": refs[1:]}
+        else:
+            record = {"value": plain_value(value), "references": refs}
+        yield dumps(record) + "\n"
+
+
+def iter_csv(
+    env: Mapping, diffable: bool = False, str_ref: Callable[[Path], str] = str
+) -> Iterator[str]:
+    """One row per reference, non string values are json encoded."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def rows() -> Iterator[List[Tuple[str, str]]]:
+        yield [("first_seen" if diffable else "value", "reference")]
+        for value, refs in _references(env, diffable, str_ref):
+            if diffable:
+                key, refs = refs[0], refs[1:]
+            else:
+                key = csv_value(value)
+            yield [(key, ref) for ref in refs]
+
+    for value_rows in rows():
+        writer.writerows(value_rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+renderers: Dict[str, Renderer] = {
+    "text": iter_text,
+    "jsonl": iter_jsonl,
+    "csv": iter_csv,
+}
+
+
+def _percentiles(histogram: Dict[int, int]) -> Iterator[Tuple[int, int, float]]:
+    """Every reference count, its number of values and the share of values up to it."""
+    total = sum(histogram.values())
+    seen = 0
+    for count, values in histogram.items():
+        seen += values
+        yield count, values, seen / total
+
+
+def iter_histogram_text(histogram: Dict[int, int], width: int = 50) -> Iterator[str]:
+    """A bar chart of a reference count histogram, with the percentile of every count."""
+    if not histogram:
+        return
+    most = max(histogram.values())
+    count_width = max(len("references"), len(str(max(histogram))))
+    values_width = max(len("values"), len(str(most)))
+    yield f"{'references':>{count_width}} {'values':>{values_width}} percentile\n"
+    for count, values, percentile in _percentiles(histogram):
+        bar = "#" * max(1, round(values / most * width))
+        yield f"{count:>{count_width}} {values:>{values_width}} {percentile:>10.1%} {bar}\n"
+
+
+def iter_histogram_jsonl(histogram: Dict[int, int]) -> Iterator[str]:
+    for count, values, percentile in _percentiles(histogram):
+        record = {"references": count, "values": values, "percentile": percentile}
+        yield dumps(record) + "\n"
+
+
+def iter_histogram_csv(histogram: Dict[int, int]) -> Iterator[str]:
+    yield "references,values,percentile\n"
+    for count, values, percentile in _percentiles(histogram):
+        yield f"{count},{values},{percentile}\n"
+
+
+histogram_renderers: Dict[str, Callable[[Dict[int, int]], Iterator[str]]] = {
+    "text": iter_histogram_text,
+    "jsonl": iter_histogram_jsonl,
+    "csv": iter_histogram_csv,
+}
+
+
+def write_env(
+    env: Mapping,
+    file: TextIO,
+    format: str = "text",
+    diffable: bool = False,
+    str_ref: Callable[[Path], str] = str,
+) -> int:
+    """Writes `env` to `file` as it is rendered, returning the number of characters written."""
+    written = 0
+    for chunk in renderers[format](env, diffable, str_ref):
+        written += file.write(chunk)
+    return written
@@ -0,0 +1,127 @@
+"""Correlations across many recordings, runs, of the same journey.
+
+A correlated value of a run is identified by where it is first seen, its first reference, like
+`--diffable` does. Values first seen at the same reference in every run are stable, e.g. a fixed
+api version, and values that differ between runs, e.g. session ids, are the ones that need to be
+correlated. `RunIndex` only keeps every distinct value and reference once, with the runs they were
+seen in as a bit mask, so its memory grows with the distinct values instead of with the runs.
+"""
+
+import csv
+import io
+from json import dumps
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+from harf.correlations.envs import plain_value
+from harf.correlations.render import csv_value
+
+# The first reference of a correlated value, the value and its other references.
+Correlation = Tuple[str, Hashable, List[str]]
+
+
+class RunIndex:
+    """The correlated values of runs, by their first reference."""
+
+    def __init__(self, runs: List[str]):
+        self.runs = runs
+        self.ids: Dict[Hashable, int] = {}
+        self.values: List[Hashable] = []
+        self.keys: Dict[str, int] = {}
+        # For every first reference, the runs of each value id as a bit mask.
+        self.key_runs: List[Dict[int, int]] = []
+        # The other references of the first run every first reference was seen in.
+        self.references: List[List[str]] = []
+
+    def add(self, run: int, correlations: Iterable[Correlation]) -> None:
+        """Adds the correlations of the `run`th run."""
+        bit = 1 << run
+        for first, value, references in correlations:
+            key = self.keys.get(first)
+            if key is None:
+                key = self.keys[first] = len(self.key_runs)
+                self.key_runs.append({})
+                self.references.append(references)
+            value_id = self.ids.get(value)
+            if value_id is None:
+                value_id = self.ids[value] = len(self.values)
+                self.values.append(value)
+            value_runs = self.key_runs[key]
+            value_runs[value_id] = value_runs.get(value_id, 0) | bit
+
+    def _run_names(self, mask: int) -> List[str]:
+        return [name for i, name in enumerate(self.runs) if mask >> i & 1]
+
+    def items(self) -> Iterator[Tuple[str, bool, Dict[Hashable, List[str]], List[str]]]:
+        """Every first reference, if its value is stable, the runs of each value and references.
+
+        A value is only stable if it was seen with the same value in every run, a value missing
+        from some runs is changing. Changing values come first, in the order they were first seen,
+        followed by stable values.
+        """
+        every_run = (1 << len(self.runs)) - 1
+        stable = []
+        for first, key in self.keys.items():
+            value_runs = self.key_runs[key]
+            item = (
+                first,
+                list(value_runs.values()) == [every_run],
+                {self.values[v]: self._run_names(m) for v, m in value_runs.items()},
+                self.references[key],
+            )
+            if item[1]:
+                stable.append(item)
+            else:
+                yield item
+        yield from stable
+
+
+def iter_runs_text(index: RunIndex) -> Iterator[str]:
+    for first, stable, value_runs, references in index.items():
+        seen = len({run for runs in value_runs.values() for run in runs})
+        kind = "Stable value" if stable else "Changing value"
+        refs = ",\n".join("    " + dumps(ref) for ref in references)
+        values = "\n".join(
+            f"    ({repr(value)}) in {', '.join(runs)}"
+            for value, runs in value_runs.items()
+        )
+        yield (
+            f"{kind} first seen at {first} in {seen}/{len(index.runs)} runs used again in:\n"
+            f"{refs}\nValues:\n{values}\n\n"
+        )
+
+
+def iter_runs_jsonl(index: RunIndex) -> Iterator[str]:
+    for first, stable, value_runs, references in index.items():
+        record = {
+            "first_seen": first,
+            "stable": stable,
+            "values": [
+                {"value": plain_value(value), "runs": runs}
+                for value, runs in value_runs.items()
+            ],
+            "references": references,
+        }
+        yield dumps(record) + "\n"
+
+
+def iter_runs_csv(index: RunIndex) -> Iterator[str]:
+    """One row per value of every run, references are left out."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["first_seen", "stable", "run", "value"])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for first, stable, value_runs, _ in index.items():
+        for value, runs in value_runs.items():
+            writer.writerows((first, stable, run, csv_value(value)) for run in runs)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+run_renderers = {
+    "text": iter_runs_text,
+    "jsonl": iter_runs_jsonl,
+    "csv": iter_runs_csv,
+}
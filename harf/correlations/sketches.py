@@ -0,0 +1,208 @@
+"""Approximate reference counts of a har in a fixed amount of memory.
+
+Filtering by reference percent needs the count of every value, the largest one sets the bounds.
+`ReferenceSketch` takes the envs of one chunk of entries at a time and only keeps a Count-Min
+sketch of the reference counts, one of the request references to tell which values are used in a
+request, a HyperLogLog of the distinct values and the few most referenced request values. Its
+`candidates` are then every value whose count might be within the bounds, only those need their
+paths built. The exact counts of the candidates are known once they are built, so the bounds and
+filter can be applied exactly to them.
+
+A Count-Min sketch never under counts, with a width of `e / epsilon` and a depth of
+`ln(1 / delta)` a count is over counted by more than `epsilon` times the number of references
+with a probability of at most `delta`.
+"""
+
+import hashlib
+from array import array
+from functools import lru_cache
+from math import ceil, e, log, sqrt
+from typing import Dict, Hashable, List, Mapping, NamedTuple, Sequence
+
+from harf.correlations.envs import plain_value
+from harf.correlations.paths import Path
+
+
+def value_hash(value: Hashable) -> int:
+    """A 64 bit hash of `value`, the same in every process.
+
+    Sketches are sent to worker processes, where the builtin `hash` of strings differs. Values
+    that are equal have the same hash, so `1`, `1.0` and `true` are hashed alike as they are equal
+    with `--loose-types`.
+    """
+    value = plain_value(value)
+    if isinstance(value, str):
+        data = b"s" + value.encode("utf-8", "surrogatepass")
+    elif value is None:
+        data = b"n"
+    elif isinstance(value, float) and not value.is_integer():
+        data = b"f" + repr(value).encode()
+    else:
+        data = b"i" + str(int(value)).encode()
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class CountMinSketch:
+    """Counts of hashed values in `depth` rows of `width` counters."""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = ceil(e / epsilon)
+        self.depth = ceil(log(1 / delta))
+        self.rows = [array("q", bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    def _columns(self, h: int) -> List[int]:
+        low, high = h & 0xFFFFFFFF, h >> 32 | 1
+        return [(low + i * high) % self.width for i in range(self.depth)]
+
+    def add(self, h: int, count: int = 1) -> None:
+        for row, column in zip(self.rows, self._columns(h)):
+            row[column] += count
+        self.total += count
+
+    def estimate(self, h: int) -> int:
+        """The count of `h`, or more."""
+        return min(row[column] for row, column in zip(self.rows, self._columns(h)))
+
+    def error(self) -> int:
+        """How much more than their count estimates are, with a probability of `1 - delta`."""
+        return ceil(self.epsilon * self.total)
+
+
+class HyperLogLog:
+    """The number of distinct hashed values, in `2 ** precision` one byte registers."""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, h: int) -> None:
+        bits = 64 - self.precision
+        rest = h & ((1 << bits) - 1)
+        register = h >> bits
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * log(m / zeros))
+        return round(raw)
+
+    def relative_error(self) -> float:
+        """The standard error of `estimate` relative to the number of distinct values."""
+        return 1.04 / sqrt(len(self.registers))
+
+
+class SketchBounds(NamedTuple):
+    """The reference count bounds of `ReferenceSketch.candidates` and how far off they can be."""
+
+    max_count: int
+    min_count: int
+    max_count_bound: int
+    error: int
+    references: int
+    distinct: int
+    distinct_error: float
+
+
+class Candidates:
+    """The values whose reference count might be within bounds, decided from a sketch.
+
+    The decisions of recently looked up values are cached, values repeat a lot between bodies.
+    """
+
+    def __init__(self, sketch: "ReferenceSketch", min_count: int, max_count: int):
+        self.sketch = sketch
+        self.min_count = min_count
+        self.max_count = max_count
+        self._contains = lru_cache(maxsize=1 << 16)(self._candidate)
+
+    def _candidate(self, value: Hashable) -> bool:
+        sketch = self.sketch
+        if value in sketch.heavy:
+            return True
+        h = value_hash(value)
+        if not sketch.requested.estimate(h):
+            return False
+        return self.min_count <= sketch.references.estimate(h) <= self.max_count
+
+    def __contains__(self, value: Hashable) -> bool:
+        return self._contains(value)
+
+    def __reduce__(self):
+        return Candidates, (self.sketch, self.min_count, self.max_count)
+
+
+class ReferenceSketch:
+    """Approximate reference counts of the values of the envs added to it.
+
+    Like joining the request and response envs, a value is referenced by the paths of both but
+    only counts if it is used in a request. The `heavy` most referenced request values are kept
+    with their estimated counts, so the largest count is never under estimated.
+    """
+
+    def __init__(
+        self,
+        epsilon: float = 0.001,
+        delta: float = 0.01,
+        heavy: int = 64,
+        precision: int = 14,
+    ):
+        self.references = CountMinSketch(epsilon, delta)
+        self.requested = CountMinSketch(epsilon, delta)
+        self.values = HyperLogLog(precision)
+        self.heavy: Dict[Hashable, int] = {}
+        self.heavy_size = heavy
+
+    def add(
+        self,
+        request_env: Mapping[Hashable, Sequence[Path]],
+        response_env: Mapping[Hashable, Sequence[Path]],
+    ) -> None:
+        """Adds the references of the request and response envs of a chunk of entries."""
+        hashes = {}
+        for env, requested in ((request_env, True), (response_env, False)):
+            for value, paths in env.items():
+                h = hashes.get(value)
+                if h is None:
+                    h = hashes[value] = value_hash(value)
+                    self.values.add(h)
+                self.references.add(h, len(paths))
+                if requested:
+                    self.requested.add(h, len(paths))
+        # A value's estimate is final enough at its last chunk, later chunks only add collisions.
+        for value, h in hashes.items():
+            if self.requested.estimate(h):
+                self.heavy[value] = self.references.estimate(h)
+        if len(self.heavy) > 2 * self.heavy_size:
+            top = sorted(self.heavy.items(), key=lambda item: item[1], reverse=True)
+            self.heavy = dict(top[: self.heavy_size])
+
+    def bounds(self, min_percent: float, max_percent: float) -> SketchBounds:
+        """The reference count bounds of values that might be between the percentages.
+
+        The largest count is between `max_count - error` and `max_count`, so the bounds are
+        widened by that and by the over counting of the candidates.
+        """
+        max_count = max(self.heavy.values(), default=0)
+        error = self.references.error()
+        return SketchBounds(
+            max_count,
+            int(max(max_count - error, 0) * min_percent),
+            int(max_count * max_percent) + error,
+            error,
+            self.references.total,
+            self.values.estimate(),
+            self.values.relative_error(),
+        )
+
+    def candidates(self, min_percent: float, max_percent: float) -> Candidates:
+        bounds = self.bounds(min_percent, max_percent)
+        return Candidates(self, bounds.min_count, bounds.max_count_bound)
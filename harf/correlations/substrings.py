@@ -0,0 +1,142 @@
+"""Response values found inside of request strings.
+
+An id returned as `123` and later sent as part of `"Bearer abc123"` is not linked by exact
+equality. `substring_env` builds an Aho-Corasick automaton of the response values and scans every
+distinct request string once, so the cost grows with the length of the request strings instead of
+with the number of values times strings. Found values get the request paths of the strings they
+are in, ending in an `OffsetPath` of where in the string they start.
+
+Short or low entropy values, like `true` or `1000`, are in a lot of strings by chance, only values
+with at least `min_length` characters and `min_entropy` bits per character are looked for.
+`pyahocorasick` is used when it is installed, otherwise a pure python automaton.
+"""
+
+import dataclasses
+from collections import Counter, deque
+from math import log2
+from typing import Dict, Hashable, Iterator, List, Mapping, Sequence, Tuple
+
+from harf.correlations.envs import Env, plain_value
+from harf.correlations.paths import EndPath, OffsetPath, Path
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover, pyahocorasick is optional
+    ahocorasick = None
+
+
+def entropy(text: str) -> float:
+    """The Shannon entropy of the characters of `text` in bits per character."""
+    size = len(text)
+    return -sum(n / size * log2(n / size) for n in Counter(text).values())
+
+
+class _Automaton:
+    """An Aho-Corasick automaton with the part of the `ahocorasick.Automaton` api used here."""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List] = [[]]
+
+    def add_word(self, word: str, value) -> None:
+        node = 0
+        for char in word:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = self.goto[node][char] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = child
+        self.out[node].append(value)
+
+    def make_automaton(self) -> None:
+        goto, fail, out = self.goto, self.fail, self.out
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                out[child] = out[child] + out[fail[child]]
+
+    def iter(self, text: str) -> Iterator[Tuple[int, object]]:
+        """The index of the last character and value of every word in `text`."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for value in out[node]:
+                yield i, value
+
+
+def _automaton():
+    return ahocorasick.Automaton() if ahocorasick is not None else _Automaton()
+
+
+def _text(value: Hashable):
+    """The text of a value that can be part of a string, `None` for other values."""
+    value = plain_value(value)
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def at_offset(path: Path, offset: int) -> Path:
+    """`path` ending in an `OffsetPath` of `offset`."""
+    links = []
+    while not isinstance(path, EndPath):
+        links.append(path)
+        path = path.next_
+    path = OffsetPath(offset, EndPath())
+    for link in reversed(links):
+        path = dataclasses.replace(link, next_=path)
+    return path
+
+
+def substring_env(
+    request_values: Mapping[Hashable, Sequence[Path]],
+    response_values: Mapping[Hashable, Sequence[Path]],
+    min_length: int = 6,
+    min_entropy: float = 2.5,
+) -> Env:
+    """The response values found inside of longer request strings, with the paths of those strings.
+
+    Values equal to a whole request string are left out, those are already linked by the envs.
+    """
+    values: Dict[str, List[Hashable]] = {}
+    for value in response_values:
+        text = _text(value)
+        if (
+            text is not None
+            and len(text) >= min_length
+            and entropy(text) >= min_entropy
+        ):
+            values.setdefault(text, []).append(value)
+    env = Env()
+    if not values:
+        return env
+    automaton = _automaton()
+    for text in values:
+        automaton.add_word(text, text)
+    automaton.make_automaton()
+    for request_value, paths in request_values.items():
+        string = plain_value(request_value)
+        if not isinstance(string, str) or len(string) <= min_length:
+            continue
+        for end, text in automaton.iter(string):
+            if len(text) == len(string):
+                continue
+            offset = end - len(text) + 1
+            found = [at_offset(path, offset) for path in paths]
+            for value in values[text]:
+                env.setdefault(value, []).extend(found)
+    return env
@@ -1,3 +1,5 @@
+from typing import Iterable, Iterator, List
+
 from harf_serde import (
     RequestF,
     EntryF,
@@ -8,27 +10,33 @@ from harf_serde import (
 )
 
 
+def comment_pages(entries: Iterable[EntryF], pages: List[Page]) -> Iterator[EntryF]:
+    """Re-pages `entries` by the Comment Request before them and drops the Comment Requests.
+
+    A `Page` is appended to `pages` for every Comment Request seen.
+    """
+    for entry in entries:
+        request = entry.request
+        if request.url.lower().startswith("http://comment"):
+            name = request.url.split("/")[-1]
+            pages.append(
+                Page(
+                    startedDateTime=entry.startedDateTime,
+                    id=name,
+                    title=name,
+                    pageTimings=PageTimings(onContentLoad=-1, onLoad=-1),
+                )
+            )
+            continue
+        pageref = pages[-1].id if len(pages) else entry.pageref
+        entry.pageref = pageref
+        yield entry
+
+
 def icomment_requests(har: FHar) -> FHar:
     if isinstance(har, LogF):
-        pages = []
-        entries = []
-        for entry in har.entries:
-            request = entry.request
-            if request.url.lower().startswith("http://comment"):
-                name = request.url.split("/")[-1]
-                pages.append(
-                    Page(
-                        startedDateTime=entry.startedDateTime,
-                        id=name,
-                        title=name,
-                        pageTimings=PageTimings(onContentLoad=-1, onLoad=-1),
-                    )
-                )
-                continue
-            pageref = pages[-1].id if len(pages) else entry.pageref
-            entry.pageref = pageref
-            entries.append(entry)
+        pages: List[Page] = []
+        har.entries = list(comment_pages(har.entries, pages))
         har.pages = pages
-        har.entries = entries
 
     return har
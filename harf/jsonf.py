@@ -22,7 +22,27 @@ def jsonf_fmap(f: Callable[[A], B], j: JsonF[A]) -> JsonF[B]:
 
 
 def jsonf_cata(a: Callable[[JsonF[A]], A], j: Json) -> A:
-    def inner(e):
-        return jsonf_cata(a, e)
-
-    return a(jsonf_fmap(inner, j))
+    """Folds `j` bottom up with the algebra `a`.
+
+    Children are folded with an explicit post-order work stack instead of recursion,
+    so arbitrarily deep json does not run into the recursion limit.
+    """
+    results: List[A] = []
+    stack: List[Tuple[Json, bool]] = [(j, False)]
+    while stack:
+        element, children_folded = stack.pop()
+        if children_folded:
+            start = len(results) - len(element)
+            children = results[start:]
+            del results[start:]
+            if isinstance(element, dict):
+                results.append(a(dict(zip(element, children))))
+            else:
+                results.append(a(children))
+        elif isinstance(element, (dict, list)):
+            stack.append((element, True))
+            values = element.values() if isinstance(element, dict) else element
+            stack.extend((e, False) for e in reversed(values))
+        else:
+            results.append(a(element))
+    return results[0]
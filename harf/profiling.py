@@ -0,0 +1,155 @@
+"""Timing of the stages of a run.
+
+Wrap each stage in `Profiler.stage` and add what it produced to the counts of the `Stage` it
+yields. Hooks are called with every finished stage, e.g. to log them as they happen:
+
+    profiler = Profiler(hooks=[print])
+    with profiler.stage("envs") as stage:
+        env = request_valued_env(har)
+        stage.counts["values"] = len(env)
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, not available on windows
+    resource = None  # type: ignore[assignment]
+
+
+def peak_rss_kib() -> int:
+    """The peak RSS of this process and its finished children in KiB, 0 if it is unknown."""
+    if resource is None:
+        return 0
+    maxrss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # `ru_maxrss` is in bytes on macOS and in KiB everywhere else.
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def cpu_time() -> float:
+    """The cpu time of this process and its finished children, like `-j` workers, in seconds.
+
+    Children only count once they exit, the workers of a stage do when their pool is shut down.
+    """
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+@dataclass
+class Stage:
+    name: str
+    start: float = 0.0
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_rss_kib: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+class Profiler:
+    """Records the `Stage`s of a run, optionally under `cProfile`."""
+
+    def __init__(
+        self,
+        hooks: Optional[List[Callable[[Stage], None]]] = None,
+        cprofile: bool = False,
+    ):
+        self.stages: List[Stage] = []
+        self.hooks = hooks or []
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Stage]:
+        stage = Stage(name, start=time.perf_counter() - self._origin)
+        cpu = cpu_time()
+        if self.cprofile:
+            self.cprofile.enable()
+        try:
+            yield stage
+        finally:
+            if self.cprofile:
+                self.cprofile.disable()
+            stage.cpu = cpu_time() - cpu
+            stage.wall = time.perf_counter() - self._origin - stage.start
+            stage.peak_rss_kib = peak_rss_kib()
+            self.stages.append(stage)
+            for hook in self.hooks:
+                hook(stage)
+
+    def summary(self) -> str:
+        """A table of the recorded stages.
+
+        Cpu time includes the worker processes of a stage, peak RSS is the largest of this process
+        and of any finished worker, not their sum.
+        """
+        rows = [("stage", "wall s", "cpu s", "peak rss MiB", "counts")]
+        for s in self.stages:
+            counts = ", ".join(f"{k}={v}" for k, v in s.counts.items())
+            rows.append(
+                (
+                    s.name,
+                    f"{s.wall:.3f}",
+                    f"{s.cpu:.3f}",
+                    f"{s.peak_rss_kib / 1024:.1f}",
+                    counts,
+                )
+            )
+        rows.append(
+            (
+                "total",
+                f"{sum(s.wall for s in self.stages):.3f}",
+                f"{sum(s.cpu for s in self.stages):.3f}",
+                f"{peak_rss_kib() / 1024:.1f}",
+                "",
+            )
+        )
+        widths = [max(len(row[i]) for row in rows) for i in range(4)]
+        return "\n".join(
+            "  ".join(
+                [row[0].ljust(widths[0])]
+                + [c.rjust(w) for c, w in zip(row[1:4], widths[1:])]
+                + [row[4]]
+            ).rstrip()
+            for row in rows
+        )
+
+    def chrome_trace(self) -> dict:
+        """The stages as complete events of the Chrome trace event format."""
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": s.name,
+                    "ph": "X",
+                    "ts": int(s.start * 1e6),
+                    "dur": int(s.wall * 1e6),
+                    "pid": pid,
+                    "tid": 0,
+                    "args": {"cpu": s.cpu, "peak_rss_kib": s.peak_rss_kib, **s.counts},
+                }
+                for s in self.stages
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def dump_chrome_trace(self, path) -> None:
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+    def dump_stats(self, path) -> None:
+        """Writes the `cProfile` stats of every stage so far to `path`, see `pstats`."""
+        if self.cprofile is None:
+            raise ValueError("The profiler was not created with cprofile=True.")
+        self.cprofile.dump_stats(path)
@@ -0,0 +1,119 @@
+"""Incremental reading of har files.
+
+`serde.json.from_json` needs the raw text, the parsed dicts and the dataclasses of the whole har in
+memory at once. Reading entries one at a time keeps only the entry being processed resident.
+"""
+
+import json
+from typing import IO, Iterator
+
+from serde import from_dict
+from harf_serde import Entry
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+_delimiters = _whitespace + ",:]}"
+
+
+class JsonReader:
+    """A cursor over json text that reads more of `file` as it is needed."""
+
+    def __init__(self, file: IO[str], chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _read(self, size: int) -> bool:
+        chunk = self.file.read(size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read(self.chunk_size):
+                raise json.JSONDecodeError(
+                    "Unexpected end of file", self.buffer, self.pos
+                )
+
+    def expect(self, chars: str) -> str:
+        """Consumes the next non whitespace character, which has to be one of `chars`."""
+        char = self.peek()
+        if char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes and consumes the next complete json value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Grow geometrically so a single large value is not re-decoded once per chunk.
+                if not self._read(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            # A number cut off by the end of the buffer, e.g. `1.` or `1e`, decodes to a prefix of
+            # itself, a complete value is always followed by a delimiter.
+            if (
+                end == len(self.buffer) or self.buffer[end] not in _delimiters
+            ) and self._read(self.chunk_size):
+                continue
+            self.pos = end
+            return value
+
+    def keys(self) -> Iterator[str]:
+        """Yields the keys of the next object, the caller has to consume each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def items(self) -> Iterator[int]:
+        """Yields the indexes of the next array, the caller has to consume each element."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        i = 0
+        while True:
+            yield i
+            i += 1
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_entries(file: IO[str]) -> Iterator[Entry]:
+    """Yields the `log.entries` of the har in `file` one at a time.
+
+    Everything else in the har is skipped.
+    """
+    reader = JsonReader(file)
+    for key in reader.keys():
+        if key != "log":
+            reader.value()
+            continue
+        for log_key in reader.keys():
+            if log_key != "entries":
+                reader.value()
+                continue
+            for _ in reader.items():
+                yield from_dict(Entry, reader.value())
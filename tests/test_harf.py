@@ -1,28 +1,102 @@
+from collections import Counter
+import csv
+import dataclasses
 from functools import partial
+import textwrap
+from io import StringIO
+import json as json_module
+import operator
+import os
+import pathlib
+import pickle
+import random
+import subprocess
+import sys
 from itertools import chain
 from json import dumps as json_dumps
 
 from hypothesis import assume, example, given, infer, note, strategies as st
 
+from serde import from_dict
+from serde.json import from_json
 from harf_serde import (
+    Har,
     harf,
     CookieF,
     HeaderF,
+    ParamF,
+    PostDataParamF,
     PostDataTextF,
     QueryStringF,
 )
 from harf.correlations.envs import (
+    Env,
+    body_env,
     json_env,
     EndPath,
     HeaderPath,
     CookiePath,
     QueryPath,
+    BodyPath,
     header_env,
+    param_env,
     post_data_env,
     cookie_env,
     query_string_env,
+    plain_value,
+)
+from harf.correlations.obsidian import (
+    FileName,
+    VariableName,
+    json_ as obsidian_json,
+    mk_links,
+    mk_obsidian,
+    renders_body,
+    _get_link,
+    write_files,
+)
+from harf.cache import load_envs, prune_cache, store_envs
+from harf.correlations.bodies import BodyFilter, BodyMemo, BodyStore
+from harf.correlations.columnar import ValueTable
+from harf.correlations.sketches import (
+    CountMinSketch,
+    HyperLogLog,
+    ReferenceSketch,
+    value_hash,
+)
+import harf.correlations.columnar as columnar
+from harf.correlations.diff import Difference, align
+from harf.correlations.runs import RunIndex
+import harf.correlations.substrings as substrings
+from harf.correlations.substrings import substring_env
+from harf.correlations.render import (
+    histogram_renderers,
+    iter_csv,
+    iter_jsonl,
+    iter_text,
+    write_env,
+)
+from harf.correlations.filters import (
+    count_histogram,
+    count_percentile,
+    filter_by_percentages,
+    reference_counts,
+    top_values,
+)
+from harf.correlations.pipeline import (
+    entries_valued_envs,
+    diff_hars,
+    har_correlations,
+    request_valued_env,
+    response_valued_env,
+    runs_index,
+    sketch_entries,
+    valued_envs,
 )
 from harf.jsonf import jsonf_cata
+from harf import profiling
+from harf.profiling import Profiler, cpu_time, peak_rss_kib
+from harf.streaming import JsonReader, iter_entries
 
 from strategies import json_prims, json, text, post_data_text
 
@@ -36,6 +110,7 @@ def _json_depth_a(json) -> int:
 
 json_depth = partial(jsonf_cata, _json_depth_a)
 
+har_path = lambda name: pathlib.Path(__file__).parent / name
 paths = lambda env: chain(*env.values())
 max_path_length = lambda env: max(map(len, paths(env)), default=0)
 
@@ -226,6 +301,23 @@ def test_the_set_of_values_is_the_inclusion_of_all_sub_values(json):
 # test_the_set_of_values_is_the_inclusion_of_all_sub_values()
 
 
+def test_deeply_nested_json_does_not_hit_the_recursion_limit():
+    depth = sys.getrecursionlimit() * 2
+    json = None
+    for _ in range(depth - 1):
+        json = [json]
+    assert json_depth(json) == depth
+    env = json_env(json)
+    assert list(env) == [None]
+    assert len(env[None]) == 1
+    assert max_path_length(env) == depth
+    assert str(env[None][0]) == "[0]" * (depth - 1)
+    assert env[None][0] == json_env(json)[None][0]
+
+
+# test_deeply_nested_json_does_not_hit_the_recursion_limit()
+
+
 @given(json=json_prims)
 def test_primitive_values_produce_primative_env(json):
     env = json_env(json)
@@ -295,3 +387,721 @@ def test_empty_post_data_returns_empty_env(post_data):
 
 
 # test_empty_post_data_returns_empty_env()
+
+
+@given(
+    elements=st.lists(json()),
+    chunk_size=st.integers(1, 16),
+    indent=st.none() | st.integers(0, 2),
+)
+def test_json_reader_reads_the_same_elements_as_json_loads(
+    elements, chunk_size, indent
+):
+    reader = JsonReader(StringIO(json_dumps(elements, indent=indent)), chunk_size)
+    read = [reader.value() for _ in reader.items()]
+    assert read == elements
+
+
+# test_json_reader_reads_the_same_elements_as_json_loads()
+
+
+def test_iter_entries_yields_the_same_entries_as_from_json():
+    with open(har_path("example1.har"), encoding="utf-8-sig") as har_file:
+        entries = list(iter_entries(har_file))
+    with open(har_path("example1.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    assert entries == har.log.entries
+
+
+# test_iter_entries_yields_the_same_entries_as_from_json()
+
+
+def test_parallel_entries_valued_envs_are_identical_to_the_har_fold():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    request_values = request_valued_env(har, headers=True, cookies=True)
+    response_values = response_valued_env(har, headers=True, cookies=True)
+    for jobs in [1, 2]:
+        envs = entries_valued_envs(
+            har.log.entries, headers=True, cookies=True, jobs=jobs, chunk_size=3
+        )
+        assert list(envs[0].items()) == list(request_values.items())
+        assert list(envs[1].items()) == list(response_values.items())
+        assert envs[2] == [e.request.url for e in har.log.entries]
+
+
+# test_parallel_entries_valued_envs_are_identical_to_the_har_fold()
+
+
+def test_parallel_entries_valued_envs_send_back_deeply_nested_bodies():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    entry = har.log.entries[0]
+    text = '{"a": ' * 900 + '"deep"' + "}" * 900
+    content = dataclasses.replace(
+        entry.response.content, text=text, mimeType="application/json"
+    )
+    response = dataclasses.replace(entry.response, content=content)
+    entries = [dataclasses.replace(entry, response=response)] + har.log.entries[1:]
+    serial = entries_valued_envs(entries)
+    parallel = entries_valued_envs(entries, jobs=2)
+    assert list(parallel[1].items()) == list(serial[1].items())
+    assert len(parallel[1]["deep"][0]) == len(serial[1]["deep"][0]) > 900
+
+
+# test_parallel_entries_valued_envs_send_back_deeply_nested_bodies()
+
+
+def test_consumed_only_keeps_the_response_values_used_in_requests():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    request_values, response_values, _ = entries_valued_envs(
+        har.log.entries, headers=True, cookies=True
+    )
+    for jobs in [1, 2]:
+        envs = entries_valued_envs(
+            har.log.entries,
+            headers=True,
+            cookies=True,
+            jobs=jobs,
+            chunk_size=3,
+            consumed_only=True,
+        )
+        assert list(envs[0].items()) == list(request_values.items())
+        assert set(envs[1]) == set(response_values) & set(request_values)
+        assert list((envs[0] + envs[1]).items()) == list(
+            (request_values + response_values).items()
+        )
+
+
+# test_consumed_only_keeps_the_response_values_used_in_requests()
+
+
+def test_count_min_never_under_counts_and_hyperloglog_is_close():
+    counts = Counter(random.Random(0).choices(range(5000), k=50000))
+    count_min = CountMinSketch(epsilon=0.01, delta=0.01)
+    distinct = HyperLogLog(precision=10)
+    for value, count in counts.items():
+        count_min.add(value_hash(value), count)
+        distinct.add(value_hash(value))
+    errors = [count_min.estimate(value_hash(v)) - c for v, c in counts.items()]
+    assert min(errors) >= 0
+    assert sum(e > count_min.error() for e in errors) <= 0.01 * len(counts)
+    assert abs(
+        distinct.estimate() - len(counts)
+    ) <= 3 * distinct.relative_error() * len(counts)
+
+
+# test_count_min_never_under_counts_and_hyperloglog_is_close()
+
+
+def test_sketch_candidates_hold_every_value_within_the_bounds():
+    for path in pathlib.Path(har_path("")).glob("*.har"):
+        with open(path, encoding="utf-8-sig") as har_file:
+            har = from_json(Har, har_file.read())
+        request_values, response_values, _ = entries_valued_envs(
+            har.log.entries, headers=True, cookies=True
+        )
+        expected = filter_by_percentages(0.1, 0.6, request_values + response_values)
+        sketch = sketch_entries(
+            har.log.entries, headers=True, cookies=True, chunk_size=3
+        )
+        candidates = sketch.candidates(0.1, 0.6)
+        request_values, response_values, _ = entries_valued_envs(
+            har.log.entries, headers=True, cookies=True, keep=candidates
+        )
+        env = filter_by_percentages(0.1, 0.6, request_values + response_values)
+        assert list(env.items()) == list(expected.items())
+
+
+# test_sketch_candidates_hold_every_value_within_the_bounds()
+
+
+def test_sketch_candidates_are_the_same_in_processes_with_another_hash_seed(tmp_path):
+    sketch = ReferenceSketch(heavy=1)
+    values = [f"value {i}" for i in range(200)] + list(range(200))
+    sketch.add(Env((v, [EndPath()]) for v in values), Env())
+    candidates = sketch.candidates(0, 1)
+    assert all(v in candidates for v in values)
+    pickled = tmp_path / "candidates.pickle"
+    pickled.write_bytes(pickle.dumps((candidates, values)))
+    script = (
+        "import pickle, sys\n"
+        "candidates, values = pickle.loads(open(sys.argv[1], 'rb').read())\n"
+        "print(sum(v in candidates for v in values))\n"
+    )
+    for seed in ["1", "2"]:
+        found = subprocess.run(
+            [sys.executable, "-c", script, str(pickled)],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert int(found.stdout) == len(values)
+
+
+# test_sketch_candidates_are_the_same_in_processes_with_another_hash_seed()
+
+
+def test_valued_envs_are_the_request_and_response_valued_envs():
+    for path in pathlib.Path(har_path("")).glob("*.har"):
+        with open(path, encoding="utf-8-sig") as har_file:
+            har = from_json(Har, har_file.read())
+        request_values, response_values = valued_envs(har, headers=True, cookies=True)
+        assert list(request_values.items()) == list(
+            request_valued_env(har, headers=True, cookies=True).items()
+        )
+        assert list(response_values.items()) == list(
+            response_valued_env(har, headers=True, cookies=True).items()
+        )
+
+
+# test_valued_envs_are_the_request_and_response_valued_envs()
+
+
+def test_typed_values_split_numbers_and_booleans_into_their_own_buckets():
+    with open(har_path("example1.har"), encoding="utf-8-sig") as har_file:
+        har = json_module.load(har_file)
+    cart = har["log"]["entries"][2]
+    cart["request"]["postData"]["text"] = json_dumps(
+        {"productId": 1, "quantity": 1, "price": 1.0, "active": True}
+    )
+    cart["response"]["content"]["text"] = json_dumps({"items": 1, "saved": True})
+    har = from_dict(Har, har)
+
+    loose = request_valued_env(har, loose_types=True) + response_valued_env(
+        har, loose_types=True
+    )
+    typed = request_valued_env(har) + response_valued_env(har)
+    assert len(loose[1]) == 9
+    assert len(typed[1]) == 6
+    assert len(typed[1.0]) == 1
+    assert len(typed[True]) == 2
+    assert len(typed) == len(loose) + 2
+    assert max(map(len, typed.values())) < max(map(len, loose.values()))
+
+
+# test_typed_values_split_numbers_and_booleans_into_their_own_buckets()
+
+
+def test_cached_envs_load_the_same_envs_that_were_stored(tmp_path):
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    request_values = request_valued_env(har, headers=True, cookies=True)
+    response_values = response_valued_env(har, headers=True, cookies=True)
+    urls = [e.request.url for e in har.log.entries]
+    store_envs(tmp_path / "nix.env", request_values, response_values, urls)
+    store_envs(tmp_path / "nix.env", request_values, response_values, urls)
+    assert [p.name for p in tmp_path.iterdir()] == ["nix.env"]
+
+    assert load_envs(tmp_path / "missing.env") is None
+    cached = load_envs(tmp_path / "nix.env")
+    env = cached[0] + cached[1]
+    expected = request_values + response_values
+    assert [(v, len(ps)) for v, ps in env.items()] == [
+        (v, len(ps)) for v, ps in expected.items()
+    ]
+    assert all(ps._paths is None for ps in env.values())
+    assert list(env.items()) == list(expected.items())
+    assert cached[2] == urls
+
+
+# test_cached_envs_load_the_same_envs_that_were_stored()
+
+
+def test_prune_cache_removes_the_least_recently_used_files(tmp_path):
+    env = Env({"a": [EndPath()]})
+    for i, name in enumerate(["a", "b", "c"]):
+        store_envs(tmp_path / f"{name}.env", env, env, [])
+        os.utime(tmp_path / f"{name}.env", (i, i))
+    size = (tmp_path / "a.env").stat().st_size
+    assert load_envs(tmp_path / "a.env") is not None
+    assert prune_cache(tmp_path, 3 * size) == 0
+    assert prune_cache(tmp_path, 2 * size) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.env", "c.env"]
+    assert prune_cache(tmp_path, 0, keep=tmp_path / "a.env") == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["a.env"]
+
+
+# test_prune_cache_removes_the_least_recently_used_files()
+
+
+def test_damaged_cache_files_are_a_miss(tmp_path):
+    env = Env({"a": [EndPath()], "b": [HeaderPath("b", EndPath())]})
+    store_envs(tmp_path / "a.env", env, env, ["https://a"])
+    data = (tmp_path / "a.env").read_bytes()
+    assert load_envs(tmp_path / "a.env") is not None
+    damaged = [data[:n] for n in [8, 12, 16, 60, len(data) - 8, len(data) - 3]]
+    damaged.append(data[:8] + (1 << 40).to_bytes(8, "little") + data[16:])
+    damaged.append(data[:16] + b"[]" + data[18:])
+    for data in damaged:
+        (tmp_path / "a.env").write_bytes(data)
+        assert load_envs(tmp_path / "a.env") is None
+
+
+# test_damaged_cache_files_are_a_miss()
+
+
+def test_profiler_records_every_stage_and_calls_its_hooks():
+    finished = []
+    profiler = Profiler(hooks=[finished.append])
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        with profiler.stage("parse") as stage:
+            har = from_json(Har, har_file.read())
+            stage.counts["entries"] = len(har.log.entries)
+    with profiler.stage("envs") as stage:
+        stage.counts["values"] = len(request_valued_env(har))
+
+    assert finished == profiler.stages
+    assert [s.name for s in profiler.stages] == ["parse", "envs"]
+    assert profiler.stages[0].counts == {"entries": 2}
+    assert profiler.stages[1].start >= profiler.stages[0].start
+    assert all(s.wall >= 0 and s.cpu >= 0 for s in profiler.stages)
+    events = profiler.chrome_trace()["traceEvents"]
+    assert [(e["name"], e["args"].get("entries")) for e in events] == [
+        ("parse", 2),
+        ("envs", None),
+    ]
+    assert profiler.summary().splitlines()[1].startswith("parse ")
+
+
+# test_profiler_records_every_stage_and_calls_its_hooks()
+
+
+def test_profiler_counts_workers_and_peak_rss_in_kib(monkeypatch):
+    class Usage:
+        ru_utime, ru_stime = 1.5, 0.5
+
+        def __init__(self, maxrss):
+            self.ru_maxrss = maxrss
+
+    class Resource:
+        RUSAGE_SELF, RUSAGE_CHILDREN = "self", "children"
+
+        def getrusage(who):
+            return Usage({"self": 2048, "children": 1024}[who])
+
+    monkeypatch.setattr(profiling, "resource", Resource)
+    monkeypatch.setattr(sys, "platform", "linux")
+    assert peak_rss_kib() == 2048
+    monkeypatch.setattr(sys, "platform", "darwin")
+    assert peak_rss_kib() == 2
+    assert cpu_time() >= 2.0
+
+
+# test_profiler_counts_workers_and_peak_rss_in_kib()
+
+
+def test_json_bodies_keep_integers_outside_of_64_bits_exact():
+    numbers = [2**64 + 1, -(2**63) - 1, 2**63, 1e19, 1.5]
+    post_data = PostDataTextF("application/json", json_dumps(numbers))
+    env = post_data_env(post_data)
+    assert [plain_value(v) for v in env] == numbers
+    assert all(type(plain_value(v)) is type(n) for v, n in zip(env, numbers))
+
+
+# test_json_bodies_keep_integers_outside_of_64_bits_exact()
+
+
+def test_body_filter_skips_bodies_and_counts_why():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    bodiless = request_valued_env(
+        har, bodies=BodyFilter(max_size=0)
+    ) + response_valued_env(har, bodies=BodyFilter(max_size=0))
+    filters = {
+        "size": BodyFilter(max_size=100),
+        "mime type": BodyFilter(ignore_mime_types=("APPLICATION/*",)),
+        "url": BodyFilter(ignore_urls=("https://*",)),
+    }
+    for reason, bodies in filters.items():
+        skipped = Counter()
+        envs = entries_valued_envs(har.log.entries, bodies=bodies, skipped=skipped)
+        assert skipped == {reason: 2}
+        assert list((envs[0] + envs[1]).items()) == list(bodiless.items())
+
+
+# test_body_filter_skips_bodies_and_counts_why()
+
+
+def test_bodies_that_fail_to_decode_are_skipped():
+    skipped = Counter()
+    for mime_type, text in [
+        ("text/xml", "<a><b>x"),
+        ("application/json", '{"a": '),
+        ("application/json; charset=utf-8", "[1, 2"),
+    ]:
+        env = post_data_env(PostDataTextF(mime_type, text), skipped=skipped)
+        assert env == {}
+    assert skipped == {"decode": 3}
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    content = har.log.entries[1].response.content
+    content.text = content.text[:-1]
+    skipped = Counter()
+    store = BodyStore(renders_body)
+    env = entries_valued_envs(har.log.entries, skipped=skipped, store=store)[1]
+    assert skipped == {"decode": 1}
+    mk_obsidian(env, har, store)
+
+
+# test_bodies_that_fail_to_decode_are_skipped()
+
+
+def test_body_memo_decodes_repeated_bodies_once():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    entries = har.log.entries * 2
+    unmemoed = entries_valued_envs(entries, memo=BodyMemo(0))
+    for jobs in [1, 2]:
+        memo = BodyMemo()
+        envs = entries_valued_envs(entries, jobs=jobs, memo=memo)
+        assert list(envs[0].items()) == list(unmemoed[0].items())
+        assert list(envs[1].items()) == list(unmemoed[1].items())
+        assert memo.hits == memo.misses == 2
+    memo = BodyMemo(1)
+    entries_valued_envs(entries, memo=memo)
+    assert len(memo.items) == 1
+
+
+# test_body_memo_decodes_repeated_bodies_once()
+
+
+def test_obsidian_export_takes_the_bodies_decoded_for_the_env():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    # Request bodies with mime type parameters are not rendered, so they are not stored.
+    har.log.entries[1].request.postData.mimeType += "; charset=utf-8"
+    har.log.entries *= 2
+    store = BodyStore(renders_body)
+    request_values, response_values, _ = entries_valued_envs(
+        har.log.entries, store=store
+    )
+    env = request_values + response_values
+    assert len(store.bodies) == 1 and set(store.counts.values()) == {2}
+    assert mk_obsidian(env, har, store) == mk_obsidian(env, har)
+    assert not store.bodies and not store.counts
+
+
+# test_obsidian_export_takes_the_bodies_decoded_for_the_env()
+
+
+def test_bodies_in_the_memo_are_stored_once_they_are_rendered():
+    text, mime_type = '{"a": [1, 2]}', "application/json; charset=utf-8"
+    memo = BodyMemo()
+    store = BodyStore(renders_body)
+    body_env(text, mime_type, memo=memo, store=store, request=True)
+    assert not store.counts
+    for _ in range(2):
+        body_env(text, mime_type, memo=memo, store=store)
+    assert memo.hits == 2 and memo.misses == 1
+    assert list(store.bodies.values()) == [{"a": [1, 2]}]
+    assert list(store.counts.values()) == [2]
+
+
+# test_bodies_in_the_memo_are_stored_once_they_are_rendered()
+
+
+def test_body_memo_forgets_envs_made_with_other_values_to_keep():
+    text, mime_type = '{"a": 1, "b": 2}', "application/json"
+    memo = BodyMemo()
+    assert set(body_env(text, mime_type, memo=memo, keep={1})) == {1}
+    assert set(body_env(text, mime_type, memo=memo, keep=memo.keep)) == {1}
+    assert set(body_env(text, mime_type, memo=memo, keep={2})) == {2}
+    assert set(body_env(text, mime_type, memo=memo)) == {1, 2}
+    assert memo.hits == 1 and memo.misses == 3
+
+
+# test_body_memo_forgets_envs_made_with_other_values_to_keep()
+
+
+def test_form_xml_and_multipart_bodies_have_the_paths_of_their_json():
+    token = {"user": "bob", "token": ["abc", "def"]}
+    bodies = {
+        "application/x-www-form-urlencoded": "user=bob&token=abc&token=def",
+        "application/soap+xml; charset=utf-8": (
+            '<s:Envelope xmlns:s="urn:s"><s:Body><Login user="bob">'
+            "<token>abc</token><token>def</token></Login></s:Body></s:Envelope>"
+        ),
+        "multipart/form-data; boundary=XX": (
+            '--XX\r\nContent-Disposition: form-data; name="user"\r\n\r\nbob\r\n'
+            '--XX\r\nContent-Disposition: form-data; name="token"\r\n'
+            'Content-Type: application/json\r\n\r\n["abc", "def"]\r\n'
+            '--XX\r\nContent-Disposition: form-data; name="f"; filename="a.png"\r\n'
+            "Content-Type: image/png\r\n\r\nPNG\r\n--XX--\r\n"
+        ),
+    }
+    wrapped = {
+        "Envelope": {"Body": {"Login": {"@user": "bob", "token": ["abc", "def"]}}}
+    }
+    for mime_type, text in bodies.items():
+        expected = wrapped if "xml" in mime_type else token
+        env = post_data_env(PostDataTextF(mime_type, text))
+        assert env == json_env(expected).map_paths(BodyPath)
+    params = [param_env(ParamF("user", "bob")), param_env(ParamF("file"))]
+    env = post_data_env(PostDataParamF("multipart/form-data", params))
+    assert env == json_env({"user": "bob"}).map_paths(BodyPath)
+    assert post_data_env(PostDataTextF("text/plain", "abc")) == {}
+
+
+# test_form_xml_and_multipart_bodies_have_the_paths_of_their_json()
+
+
+@given(
+    words=st.lists(st.text(alphabet="ab", min_size=1), max_size=8),
+    text=st.text(alphabet="abc"),
+)
+def test_pure_python_automaton_finds_every_occurrence(words, text):
+    automaton = substrings._Automaton()
+    for word in set(words):
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    expected = {
+        (i + len(w) - 1, w)
+        for w in set(words)
+        for i in range(len(text))
+        if text.startswith(w, i)
+    }
+    assert set(automaton.iter(text)) == expected
+
+
+def test_substring_env_links_values_inside_of_request_strings(monkeypatch):
+    token = "f81d4fae7dec11d0a765"
+    request_values = Env(
+        {
+            f"Bearer {token}": [HeaderPath("Authorization", EndPath())],
+            token: [QueryPath("token", EndPath())],
+            "true": [QueryPath("flag", EndPath())],
+        }
+    )
+    response_values = Env({token: [BodyPath(EndPath())], "true": [BodyPath(EndPath())]})
+    for automaton in [substrings.ahocorasick, None]:
+        monkeypatch.setattr(substrings, "ahocorasick", automaton)
+        env = substring_env(request_values, response_values, min_length=6)
+        assert {v: list(map(str, ps)) for v, ps in env.items()} == {
+            token: [".header.Authorization@7"]
+        }
+
+
+# test_substring_env_links_values_inside_of_request_strings()
+
+
+def test_columnar_env_operations_are_the_same_as_env_operations(monkeypatch):
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    request_values = request_valued_env(har, headers=True, cookies=True)
+    response_values = response_valued_env(har, headers=True, cookies=True)
+    for numpy in [columnar.np, None]:
+        monkeypatch.setattr(columnar, "np", numpy)
+        table = ValueTable()
+        request_view = table.add(request_values).view()
+        response_view = table.add(response_values).view()
+        assert list(response_view.items()) == list(response_values.items())
+        for op in [operator.add, operator.sub, operator.or_]:
+            for a, b, env_a, env_b in [
+                (request_view, response_view, request_values, response_values),
+                (response_view, request_view, response_values, request_values),
+            ]:
+                view = op(a, b)
+                env = op(env_a, env_b)
+                assert list(view.items()) == list(env.items())
+                assert len(view) == len(env)
+                assert all(view[v] == ps for v, ps in env.items())
+
+
+# test_columnar_env_operations_are_the_same_as_env_operations()
+
+
+def test_top_values_and_histograms_agree_with_the_env():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    env = response_valued_env(har, headers=True, cookies=True)
+    view = ValueTable().add(env).view()
+    counts = [len(ps) for ps in env.values()]
+    assert reference_counts(view) == counts
+    histogram = count_histogram(counts)
+    assert histogram == count_histogram(reference_counts(view))
+    assert sum(histogram.values()) == len(env)
+    assert count_percentile(histogram, 1) == max(counts)
+    top = top_values(view, 5)
+    assert list(top) == sorted(env, key=lambda v: len(env[v]), reverse=True)[:5]
+    assert all(top[v] == env[v] for v in top)
+    assert list(top_values(env, len(env))) == list(top_values(view, len(env)))
+    max_count = max(counts)
+    assert filter_by_percentages(0.1, 0.9, view) == {
+        v: ps
+        for v, ps in env.items()
+        if int(max_count * 0.1) <= len(ps) <= int(max_count * 0.9)
+    }
+    assert filter_by_percentages(0, 1, Env()) == {}
+
+
+# test_top_values_and_histograms_agree_with_the_env()
+
+
+def test_rendered_envs_hold_every_reference():
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = from_json(Har, har_file.read())
+    env = request_valued_env(har, headers=True, cookies=True) + response_valued_env(
+        har, headers=True, cookies=True
+    )
+    records = [json_module.loads(line) for line in iter_jsonl(env)]
+    assert [r["value"] for r in records] == list(map(plain_value, env))
+    assert [r["references"] for r in records] == [
+        list(map(str, ps)) for ps in env.values()
+    ]
+    rows = list(csv.reader(StringIO("".join(iter_csv(env, diffable=True)))))
+    assert rows[0] == ["first_seen", "reference"]
+    assert len(rows) - 1 == sum(len(ps) - 1 for ps in env.values())
+    out = StringIO()
+    assert write_env(env, out, "text", diffable=True) == len(out.getvalue())
+    assert out.getvalue() == "".join(iter_text(env, diffable=True))
+
+
+# test_rendered_envs_hold_every_reference()
+
+
+def test_histogram_renderers_hold_every_count():
+    histogram = {1: 6, 2: 3, 5: 1}
+    text = "".join(histogram_renderers["text"](histogram)).splitlines()
+    assert text[0].split() == ["references", "values", "percentile"]
+    assert [line.split()[:3] for line in text[1:]] == [
+        ["1", "6", "60.0%"],
+        ["2", "3", "90.0%"],
+        ["5", "1", "100.0%"],
+    ]
+    records = list(map(json_module.loads, histogram_renderers["jsonl"](histogram)))
+    assert {r["references"]: r["values"] for r in records} == histogram
+    assert records[-1]["percentile"] == 1
+    rows = list(csv.reader(StringIO("".join(histogram_renderers["csv"](histogram)))))
+    assert rows[0] == ["references", "values", "percentile"]
+    assert {int(r[0]): int(r[1]) for r in rows[1:]} == histogram
+
+
+# test_histogram_renderers_hold_every_count()
+
+
+def test_run_index_splits_stable_and_changing_values(tmp_path):
+    with open(har_path("nix_search.har"), encoding="utf-8-sig") as har_file:
+        har = har_file.read()
+    runs = []
+    for i, name in enumerate(["filter_packages", "filter_pkgs", "filter_packages"]):
+        runs.append(str(tmp_path / f"run{i}.har"))
+        pathlib.Path(runs[-1]).write_text(har.replace("filter_packages", name))
+    options = dict(headers=True, cookies=True, loose_types=False)
+    index = runs_index(runs, **options)
+    changing = [item for item in index.items() if not item[1]]
+    assert [(first, value_runs) for first, _, value_runs, _ in changing] == [
+        (
+            "entry_1.request.body.query.bool.filter[0].term.type._name",
+            {"filter_packages": [runs[0], runs[2]], "filter_pkgs": [runs[1]]},
+        )
+    ]
+    correlations = har_correlations(runs[0], **options)
+    assert len(index.keys) == len(correlations)
+    assert runs_index(runs, jobs=2, **options).key_runs == index.key_runs
+
+
+# test_run_index_splits_stable_and_changing_values()
+
+
+def test_values_missing_from_a_run_are_not_stable():
+    index = RunIndex(["a", "b"])
+    index.add(0, [("x", 1, []), ("y", 2, [])])
+    index.add(1, [("y", 2, [])])
+    assert [(first, stable) for first, stable, _, _ in index.items()] == [
+        ("x", False),
+        ("y", True),
+    ]
+
+
+# test_values_missing_from_a_run_are_not_stable()
+
+
+def test_diff_aligns_entries_by_request_template(tmp_path):
+    with open(har_path("gorest_demo.har"), encoding="utf-8-sig") as har_file:
+        har = json_module.load(har_file)
+    other = json_module.loads(json_module.dumps(har).replace("2548", "3001"))
+    extra = json_module.loads(json_module.dumps(other["log"]["entries"][0]))
+    extra["request"]["method"] = "POST"
+    other["log"]["entries"].insert(0, extra)
+    paths = [str(tmp_path / "a.har"), str(tmp_path / "b.har")]
+    for path, recording in zip(paths, [har, other]):
+        pathlib.Path(path).write_text(json_module.dumps(recording))
+    assert align([[1, 2, 1], [3, 1, 1, 2]]) == [[0, 1], [1, 3], [2, 2], [None, 0]]
+    diffs = list(diff_hars(paths, headers=False, cookies=False, loose_types=False))
+    assert diffs == [
+        Difference(
+            "GET gorest.co.in/public/{}/users/{}",
+            "request.url[3]",
+            (0, 1),
+            (1, 2),
+            (2548, 3001),
+        )
+    ]
+
+
+# test_diff_aligns_entries_by_request_template()
+
+
+def test_write_files_skips_files_unchanged_since_the_last_export(tmp_path):
+    files = {
+        FileName("request_0.md"): "# GET products",
+        FileName(".obsidian/snippets/entry.css"): ".request li {}",
+    }
+    stats = write_files({**files, VariableName("url"): "products"}, tmp_path)
+    assert (stats.written, stats.skipped) == (2, 0)
+    assert stats.bytes_written == sum(len(v) for v in files.values())
+    assert (tmp_path / "request_0.md").read_text() == "# GET products"
+
+    stats = write_files(files, tmp_path)
+    assert (stats.written, stats.skipped, stats.bytes_written) == (0, 2, 0)
+
+    (tmp_path / "request_0.md").unlink()
+    files[FileName(".obsidian/snippets/entry.css")] = ".response li {}"
+    stats = write_files(files, tmp_path)
+    assert (stats.written, stats.skipped) == (2, 0)
+    assert (tmp_path / ".obsidian/snippets/entry.css").read_text() == ".response li {}"
+
+
+# test_write_files_skips_files_unchanged_since_the_last_export()
+
+
+def _nested_json_str(links, element) -> str:
+    """The obsidian json algebra from before notes were rendered into a single buffer."""
+    if isinstance(element, dict):
+        res = "- \\{\n"
+        for k, v in element.items():
+            key = repr(k).replace("'", '"')
+            res += textwrap.indent(f"- {key}: {v.lstrip('- ')}", " " * 4) + "\n"
+        return res + "- \\}"
+    elif isinstance(element, list):
+        res = "- \\[\n"
+        for e in element:
+            res += textwrap.indent("- " + e.lstrip("- "), " " * 4) + "\n"
+        return res + "- \\]"
+    else:
+        return _get_link(links, element)
+
+
+@given(json=json(), linked=json())
+@example(json={"a\n \nb": [-1, "-", 1.5]}, linked={"a\n \nb": ["-"]})
+def test_obsidian_json_is_the_same_as_the_nested_algebra(json, linked):
+    links = mk_links(json_env(linked))
+    expected = jsonf_cata(partial(_nested_json_str, links), json)
+    assert obsidian_json(links, json) == expected
+
+
+# test_obsidian_json_is_the_same_as_the_nested_algebra()
+
+
+def test_obsidian_links_are_labelled_with_the_value_that_is_looked_up():
+    links = mk_links(json_env([0, False, "it's"], loose_types=True))
+    assert _get_link(links, False) == "[[_0|False]]"
+    assert _get_link(links, 0) == "[[_0|0]]"
+    assert _get_link(links, "it's") == '"[[_2|it\'s]]"'
+    assert _get_link(links, 1.5) == "1.5"
+
+
+# test_obsidian_links_are_labelled_with_the_value_that_is_looked_up()